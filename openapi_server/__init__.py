@@ -55,8 +55,38 @@ def main():
 
     specification_dir = os.path.join(os.path.dirname(__file__), 'openapi')
     app = connexion.AioHttpApp(__name__, specification_dir=specification_dir, options=options)
+    from openapi_server.controllers import utils as ctls_utils
+    app.app.middlewares.append(ctls_utils.db_io_middleware)
     app.add_api('openapi.yaml',
                 arguments={'title': 'SQAaaS API'},
                 pythonic_params=True,
                 pass_context_arg_name='request')
     app.run(port=options_cli.port)
+
+
+def migrate_db():
+    parser = argparse.ArgumentParser(
+        description='Imports a JSON DB file into the configured SQAaaS DB backend.')
+    parser.add_argument(
+        '-c',
+        '--config',
+        metavar='CONFIG_FILE',
+        dest='config_file',
+        default='/etc/sqaaas/sqaaas.ini',
+        help='Main configuration file (default: /etc/sqaaas/sqaaas.ini)')
+    parser.add_argument(
+        '-d',
+        '--debug',
+        action="store_true",
+        help='Set DEBUG log level')
+    parser.add_argument(
+        'db_file',
+        metavar='DB_FILE',
+        help='JSON DB file to import (i.e. an existing sqaaas.json)')
+    options_cli = parser.parse_args()
+
+    set_log(options_cli.debug)
+    config.init(options_cli.config_file)
+
+    from openapi_server.controllers import db
+    db.import_content(options_cli.db_file)
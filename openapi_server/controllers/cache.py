@@ -0,0 +1,51 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """Thread-safe LRU cache whose entries expire after a given time."""
+    def __init__(self, ttl, max_size):
+        """TTLCache object definition.
+
+        :param ttl: Time (seconds) an entry is kept (None to only drop the
+                    entries when max_size is exceeded)
+        :param max_size: Maximum number of entries, the least recently used
+                         entry is dropped when exceeded
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value for the given key, None if not found."""
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                return None
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            expires_at = None
+            if self.ttl is not None:
+                expires_at = time.monotonic() + self.ttl
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -1,34 +1,827 @@
+import asyncio
+import contextlib
+import contextvars
+import fcntl
+import functools
 import json
 import logging
+import os
 import pathlib
+import sqlite3
+import sys
+import tempfile
+import threading
 
 from openapi_server import config
 
 
+DB_BACKEND = config.get('db_backend', fallback='file')
 DB_FILE = pathlib.Path(
     config.get('db_file', fallback='/sqaaas/sqaaas.json'))
+DB_JOURNAL_MAX_SIZE = int(
+    config.get('db_journal_max_size', fallback=1048576))
+DB_SQLITE_FILE = pathlib.Path(
+    config.get('db_sqlite_file', fallback='/sqaaas/sqaaas.db'))
+DB_DIR = pathlib.Path(
+    config.get('db_dir', fallback='/sqaaas/pipelines'))
+DB_COMMIT_WINDOW = float(
+    config.get('db_commit_window', fallback=0.01))
 logger = logging.getLogger('sqaaas_api.controller.db')
 
+# Bytes read from and written to the DB storage while serving a request
+_io_stats = contextvars.ContextVar('db_io_stats', default=None)
 
-def load_content():
-    data = {}
-    if DB_FILE.exists():
-        data = json.loads(DB_FILE.read_text(encoding='utf-8'))
-    return data
 
+def start_io_stats():
+    """Starts counting the DB I/O bytes in the current context.
 
-def store_content(data):
+    Returns the dict that holds the counters ('read' and 'written').
+    """
+    stats = {'read': 0, 'written': 0}
+    _io_stats.set(stats)
+    return stats
+
+
+def _count_io(read=0, written=0):
+    stats = _io_stats.get()
+    if stats is not None:
+        stats['read'] += read
+        stats['written'] += written
+
+
+async def _run_in_executor(func, *args):
+    """Runs the blocking DB function in the loop's default executor."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_event_loop().run_in_executor(
+        None, functools.partial(ctx.run, func, *args))
+
+
+def _read_file(path):
+    content = path.read_bytes()
+    _count_io(read=len(content))
+    return content
+
+
+def _create_parent_folder(path):
     try:
-        DB_FILE.parent.mkdir(parents=True, exist_ok=False)
+        path.parent.mkdir(parents=True, exist_ok=False)
     except FileExistsError:
         logger.debug('DB file path: parent folder already exists')
     else:
         logger.debug('DB file path: parent folder created')
 
-    DB_FILE.write_text(json.dumps(data), encoding='utf-8')
-    print_content()
+
+def _write_atomic(path, content):
+    """Writes the content to a temporary file and renames it to path."""
+    content = content.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(
+        dir=str(path.parent), prefix='.%s.' % path.name)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, str(path))
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    _count_io(written=len(content))
+
+
+class FileBackend(object):
+    """Stores the whole DB content as a single JSON file.
+
+    The parsed content is kept in memory and only re-read from disk when
+    the file's (mtime, size) signature changes. The on_reload function, if
+    set, is called with the new content every time the file is re-read.
+    """
+    def __init__(self, db_file):
+        """FileBackend object definition.
+
+        :param db_file: Path to the JSON file used as DB
+        """
+        self.db_file = db_file
+        self.on_reload = None
+        self._stat = None
+        self._data = {}
+
+    def _get_file_stat(self):
+        try:
+            st = self.db_file.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def is_stale(self):
+        """Checks whether the file has changed since it was last read."""
+        return self._get_file_stat() != self._stat
+
+    def load(self):
+        stat = self._get_file_stat()
+        if stat is None:
+            reloaded = self._stat is not None
+            self._stat = None
+            self._data = {}
+        elif stat != self._stat:
+            logger.debug('DB file changed on disk: loading content')
+            self._data = json.loads(_read_file(self.db_file))
+            self._stat = stat
+            reloaded = True
+        else:
+            reloaded = False
+        if reloaded and self.on_reload:
+            self.on_reload(self._data)
+        return self._data
+
+    def ids(self):
+        return set(self.load())
+
+    def get_many(self, pipeline_ids):
+        return [
+            (pipeline_id, self.get(pipeline_id)) for pipeline_id in pipeline_ids
+        ]
+
+    def get(self, pipeline_id):
+        return self.load().get(pipeline_id)
+
+    def apply(self, changes):
+        _data = dict(self.load())
+        for pipeline_id, pipeline_data in changes.items():
+            if pipeline_data is None:
+                _data.pop(pipeline_id, None)
+            else:
+                _data[pipeline_id] = pipeline_data
+        self.store(_data)
+
+    def store(self, data):
+        _create_parent_folder(self.db_file)
+        try:
+            _write_atomic(self.db_file, json.dumps(data))
+        except Exception:
+            self._stat = None
+            raise
+        self._data = data
+        self._stat = self._get_file_stat()
+
+
+class JournalBackend(object):
+    """Appends each DB mutation as one record to a journal file.
+
+    The content is rebuilt at startup from the snapshot file (db_file) plus
+    the journal, and then kept in memory (replaced, never modified, on each
+    change). Once the journal grows beyond
+    max_size bytes, it is compacted into a new snapshot in a background
+    thread. Only one server process must use the journal at a time.
+    """
+    def __init__(self, db_file, max_size):
+        """JournalBackend object definition.
+
+        :param db_file: Path to the JSON file used as DB snapshot
+        :param max_size: Journal size (bytes) that triggers the compaction
+        """
+        self.snapshot_file = db_file
+        self.journal_file = db_file.with_name(db_file.name + '.journal')
+        self.rotated_journal_file = db_file.with_name(
+            db_file.name + '.journal.old')
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._compaction = None
+
+        _create_parent_folder(self.snapshot_file)
+        self._data = self._load_snapshot()
+        self._replay(self.rotated_journal_file, self._data)
+        self._replay(self.journal_file, self._data, truncate=True)
+        if self.rotated_journal_file.exists():
+            self._compact_in_background()
+
+    @staticmethod
+    def _apply(data, record):
+        if record['op'] == 'put':
+            data[record['id']] = record['data']
+        elif record['op'] == 'delete':
+            data.pop(record['id'], None)
+
+    def _load_snapshot(self):
+        data = {}
+        if self.snapshot_file.exists():
+            data = json.loads(_read_file(self.snapshot_file))
+        return data
+
+    def _replay(self, journal_file, data, truncate=False):
+        """Applies the records of the journal file to data.
+
+        :param journal_file: Path to the journal file
+        :param data: DB content the records are applied to
+        :param truncate: Whether to drop an incomplete last record
+        """
+        if not journal_file.exists():
+            return
+        valid_size = 0
+        with journal_file.open('rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    logger.warning('Incomplete record found at the end of DB journal <%s>' % journal_file)
+                    break
+                self._apply(data, json.loads(line.decode('utf-8')))
+                valid_size += len(line)
+        _count_io(read=valid_size)
+        if truncate and valid_size != journal_file.stat().st_size:
+            os.truncate(str(journal_file), valid_size)
+
+    def _append(self, records):
+        lines = ''.join([json.dumps(record) + '\n' for record in records])
+        lines = lines.encode('utf-8')
+        with self._lock:
+            with self.journal_file.open('ab') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                journal_size = f.tell()
+            _count_io(written=len(lines))
+            data = dict(self._data)
+            for record in records:
+                self._apply(data, record)
+            self._data = data
+        if journal_size > self.max_size:
+            self._compact_in_background()
+
+    def _compact_in_background(self):
+        with self._lock:
+            if self._compaction and self._compaction.is_alive():
+                return
+            if not self.rotated_journal_file.exists():
+                os.replace(
+                    str(self.journal_file), str(self.rotated_journal_file))
+            self._compaction = threading.Thread(
+                target=self._compact, daemon=True)
+            self._compaction.start()
+
+    def _compact(self):
+        """Merges the rotated journal into the snapshot file.
+
+        Works only with on-disk data, so the in-memory content can keep
+        being modified while the compaction runs.
+        """
+        data = self._load_snapshot()
+        self._replay(self.rotated_journal_file, data)
+        _write_atomic(self.snapshot_file, json.dumps(data))
+        self.rotated_journal_file.unlink()
+        logger.debug('DB journal compacted into snapshot file <%s>' % self.snapshot_file)
+
+    def load(self):
+        return self._data
+
+    def ids(self):
+        return set(self._data)
+
+    def get_many(self, pipeline_ids):
+        return [
+            (pipeline_id, self.get(pipeline_id)) for pipeline_id in pipeline_ids
+        ]
+
+    def get(self, pipeline_id):
+        return self._data.get(pipeline_id)
+
+    def apply(self, changes):
+        records = []
+        for pipeline_id, pipeline_data in changes.items():
+            if pipeline_data is None:
+                records.append({'op': 'delete', 'id': pipeline_id})
+            else:
+                records.append(
+                    {'op': 'put', 'id': pipeline_id, 'data': pipeline_data})
+        self._append(records)
+
+    def store(self, data):
+        changes = dict([
+            (pipeline_id, None)
+            for pipeline_id in list(self._data) if pipeline_id not in data
+        ])
+        changes.update(data)
+        self.apply(changes)
+
+
+class SQLiteBackend(object):
+    """Stores each pipeline as a row of a SQLite database.
+
+    The database runs in WAL mode, so readers are not blocked by writes.
+    """
+    def __init__(self, db_file):
+        """SQLiteBackend object definition.
+
+        :param db_file: Path to the SQLite database file
+        """
+        self.db_file = db_file
+        self._local = threading.local()
+
+        _create_parent_folder(self.db_file)
+        with self._get_connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pipelines ('
+                ' pipeline_id TEXT PRIMARY KEY,'
+                ' pipeline_repo TEXT,'
+                ' job_name TEXT,'
+                ' data TEXT NOT NULL)')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS pipelines_pipeline_repo'
+                ' ON pipelines (pipeline_repo)')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS pipelines_job_name'
+                ' ON pipelines (job_name)')
+
+    def _get_connection(self):
+        """Returns the SQLite connection of the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file))
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _get_row(pipeline_id, data):
+        job_name = data.get('jenkins', {}).get('job_name')
+        return (pipeline_id, data.get('pipeline_repo'), job_name, json.dumps(data))
+
+    def load(self):
+        rows = self._get_connection().execute(
+            'SELECT pipeline_id, data FROM pipelines')
+        data = {}
+        for pipeline_id, pipeline_data in rows:
+            _count_io(read=len(pipeline_data))
+            data[pipeline_id] = json.loads(pipeline_data)
+        return data
+
+    def ids(self):
+        rows = self._get_connection().execute(
+            'SELECT pipeline_id FROM pipelines')
+        return set([row[0] for row in rows])
+
+    def get_many(self, pipeline_ids):
+        rows = self._get_connection().execute(
+            'SELECT pipeline_id, data FROM pipelines WHERE pipeline_id IN (%s)'
+            % ', '.join(['?'] * len(pipeline_ids)), pipeline_ids)
+        data = {}
+        for pipeline_id, pipeline_data in rows:
+            _count_io(read=len(pipeline_data))
+            data[pipeline_id] = json.loads(pipeline_data)
+        return [
+            (pipeline_id, data.get(pipeline_id)) for pipeline_id in pipeline_ids
+        ]
+
+    def get(self, pipeline_id):
+        row = self._get_connection().execute(
+            'SELECT data FROM pipelines WHERE pipeline_id = ?',
+            (pipeline_id,)).fetchone()
+        if row:
+            _count_io(read=len(row[0]))
+            return json.loads(row[0])
+        return None
+
+    def apply(self, changes):
+        rows = [
+            self._get_row(pipeline_id, pipeline_data)
+            for pipeline_id, pipeline_data in changes.items()
+            if pipeline_data is not None
+        ]
+        deleted = [
+            (pipeline_id,)
+            for pipeline_id, pipeline_data in changes.items()
+            if pipeline_data is None
+        ]
+        with self._get_connection() as conn:
+            conn.executemany(
+                'DELETE FROM pipelines WHERE pipeline_id = ?', deleted)
+            conn.executemany(
+                'INSERT OR REPLACE INTO pipelines VALUES (?, ?, ?, ?)', rows)
+        _count_io(written=sum([len(row[-1]) for row in rows]))
+
+    def store(self, data):
+        rows = [
+            self._get_row(pipeline_id, pipeline_data)
+            for pipeline_id, pipeline_data in data.items()
+        ]
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM pipelines')
+            conn.executemany('INSERT INTO pipelines VALUES (?, ?, ?, ?)', rows)
+        _count_io(written=sum([len(row[-1]) for row in rows]))
+
+
+class ShardedBackend(object):
+    """Stores each pipeline in its own <db_dir>/<pipeline_id>.json file.
+
+    The list of pipeline IDs is kept in the <db_dir>/index.json file. All
+    the files are written atomically. The index is re-read before being
+    rewritten, under a file lock, so the IDs added by other processes (e.g.
+    sqaaas_api_migrate_db) are kept.
+    """
+    def __init__(self, db_dir):
+        """ShardedBackend object definition.
+
+        :param db_dir: Path to the folder holding the pipeline files
+        """
+        self.db_dir = db_dir
+        self.index_file = db_dir / 'index.json'
+        self.lock_file = db_dir / '.index.lock'
+        self._lock = threading.Lock()
+
+        self.db_dir.mkdir(parents=True, exist_ok=True)
+        with self._index_lock():
+            if self.index_file.exists():
+                self._ids = self._read_index()
+            else:
+                logger.debug('DB index file not found: rebuilding it from <%s>' % self.db_dir)
+                self._ids = set([
+                    path.stem for path in self.db_dir.glob('*.json')
+                    if path != self.index_file
+                ])
+                self._store_index()
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Locks the index against the threads and processes using db_dir."""
+        with self._lock:
+            with self.lock_file.open('a') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _get_path(self, pipeline_id):
+        return self.db_dir / ('%s.json' % pipeline_id)
+
+    def _read_index(self):
+        return set(json.loads(_read_file(self.index_file)))
+
+    def _store_index(self):
+        _write_atomic(self.index_file, json.dumps(sorted(self._ids)))
+
+    def load(self):
+        data = {}
+        for pipeline_id in list(self._ids):
+            pipeline_data = self.get(pipeline_id)
+            if pipeline_data is not None:
+                data[pipeline_id] = pipeline_data
+        return data
+
+    def ids(self):
+        return set(self._ids)
+
+    def get_many(self, pipeline_ids):
+        return [
+            (pipeline_id, self.get(pipeline_id)) for pipeline_id in pipeline_ids
+        ]
+
+    def get(self, pipeline_id):
+        if pipeline_id not in self._ids:
+            return None
+        try:
+            content = _read_file(self._get_path(pipeline_id))
+        except FileNotFoundError:
+            return None
+        return json.loads(content)
+
+    def _commit(self, changes, replace=False):
+        """Writes the changed pipelines and updates the index.
+
+        :param changes: dict with the pipeline data (None if deleted) by ID
+        :param replace: Whether the pipelines not in changes are deleted
+        """
+        for pipeline_id, pipeline_data in changes.items():
+            if pipeline_data is not None:
+                _write_atomic(
+                    self._get_path(pipeline_id), json.dumps(pipeline_data))
+        with self._index_lock():
+            ids = set(self._ids)
+            if self.index_file.exists():
+                ids = self._read_index()
+            deleted = set([
+                pipeline_id
+                for pipeline_id, pipeline_data in changes.items()
+                if pipeline_data is None
+            ])
+            if replace:
+                deleted.update(ids - set(changes))
+            self._ids = (ids | set(changes)) - deleted
+            if self._ids != ids or not self.index_file.exists():
+                self._store_index()
+        for pipeline_id in deleted:
+            try:
+                self._get_path(pipeline_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    def apply(self, changes):
+        self._commit(changes)
+
+    def store(self, data):
+        self._commit(data, replace=True)
+
+
+class Writer(object):
+    """Commits the DB mutations in batches (group commit).
+
+    The mutations submitted within the same time window are resolved
+    against the latest DB content and flushed to the backend at once. The
+    bytes written are counted per request as the size of the data set by
+    its own mutations.
+    """
+    def __init__(self, backend, window):
+        """Writer object definition.
+
+        :param backend: DB backend the mutations are committed to
+        :param window: Time (seconds) to wait for mutations before a flush
+        """
+        self.backend = backend
+        self.window = window
+        self._pending = []
+        self._flush_task = None
+        self._flush_lock = None
+
+    async def submit(self, op, pipeline_id, data=None, if_match=None):
+        """Queues a mutation and waits until it has been committed.
+
+        :param op: Type of mutation: 'put', 'update' or 'delete'
+        :param pipeline_id: ID of the pipeline
+        :param data: Pipeline data (put) or top-level keys to set (update)
+        :param if_match: Top-level keys (and values) the pipeline data must
+                         have for the update to be applied
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append(
+            ((op, pipeline_id, data, if_match), _io_stats.get(), future))
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        await future
+
+    def _resolve(self, mutations):
+        """Returns the resulting data of each changed pipeline.
+
+        Deleted pipelines are returned with None data. The size of the data
+        set by each mutation is returned as well (0 if discarded).
+        """
+        changes = {}
+        sizes = []
+        for op, pipeline_id, data, if_match in mutations:
+            sizes.append(0)
+            if op == 'update':
+                if pipeline_id in changes:
+                    current = changes[pipeline_id]
+                else:
+                    current = self.backend.get(pipeline_id)
+                if current is None:
+                    logger.warning('Pipeline <%s> not found in DB: discarding update' % pipeline_id)
+                    continue
+                if if_match and any([
+                        current.get(k) != v for k, v in if_match.items()]):
+                    logger.debug('Pipeline <%s> changed in DB: discarding update' % pipeline_id)
+                    continue
+                data = dict(current, **data)
+            changes[pipeline_id] = data
+            if data is not None:
+                sizes[-1] = len(json.dumps(data))
+        return changes, sizes
+
+    def _commit(self, mutations):
+        changes, sizes = self._resolve(mutations)
+        self.backend.apply(changes)
+        _update_index(changes)
+        return changes, sizes
+
+    async def _flush(self):
+        # The flush task inherits the context of the first submitter, whose
+        # request must not be charged with the I/O of the whole batch
+        _io_stats.set(None)
+        await asyncio.sleep(self.window)
+        # Mutations keep being grouped while the previous flush is running
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            self._flush_task = None
+            try:
+                changes, sizes = await _run_in_executor(
+                    self._commit, [mutation for mutation, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                logger.debug('DB commit: %s mutation/s, %s pipeline/s changed' % (
+                    len(batch), len(changes)))
+                for (_, stats, future), size in zip(batch, sizes):
+                    # Each request is charged with the data of its mutation
+                    if stats is not None:
+                        stats['written'] += size
+                    if not future.done():
+                        future.set_result(None)
+
+
+if DB_BACKEND == 'file':
+    backend = FileBackend(DB_FILE)
+elif DB_BACKEND == 'journal':
+    backend = JournalBackend(DB_FILE, DB_JOURNAL_MAX_SIZE)
+elif DB_BACKEND == 'sqlite':
+    backend = SQLiteBackend(DB_SQLITE_FILE)
+elif DB_BACKEND == 'shard':
+    backend = ShardedBackend(DB_DIR)
+else:
+    logger.error('DB backend <%s> not supported' % DB_BACKEND)
+    sys.exit(1)
+writer = Writer(backend, DB_COMMIT_WINDOW)
+# IDs of the pipelines in the DB, kept in sync with the commits
+_index = backend.ids()
+# IDs of the pipelines by Jenkins job name (and the other way round), built
+# on first use and kept in sync with the commits
+_job_index = None
+_job_names = {}
+_job_index_lock = threading.Lock()
+
+
+def _get_job_name(pipeline_data):
+    if pipeline_data:
+        return pipeline_data.get('jenkins', {}).get('job_name')
+
+
+def _set_job_name(pipeline_id, job_name, job_index, job_names):
+    old_job_name = job_names.pop(pipeline_id, None)
+    if old_job_name:
+        job_index[old_job_name].discard(pipeline_id)
+        if not job_index[old_job_name]:
+            del job_index[old_job_name]
+    if job_name:
+        job_names[pipeline_id] = job_name
+        job_index.setdefault(job_name, set()).add(pipeline_id)
+
+
+def _build_job_index():
+    global _job_index, _job_names
+    # Loaded before taking the lock, since a reload resets the index
+    data = backend.load()
+    with _job_index_lock:
+        if _job_index is None:
+            job_index, job_names = {}, {}
+            for pipeline_id, pipeline_data in data.items():
+                _set_job_name(
+                    pipeline_id, _get_job_name(pipeline_data),
+                    job_index, job_names)
+            _job_index, _job_names = job_index, job_names
+
+
+def _reset_index(data):
+    """Rebuilds the indexes from the given DB content.
+
+    :param data: Whole DB content, e.g. as re-read from disk
+    """
+    global _index, _job_index
+    _index = set(data)
+    with _job_index_lock:
+        _job_index = None
+
+
+if DB_BACKEND == 'file':
+    # The DB file can be modified by other processes, e.g. a DB import
+    backend.on_reload = _reset_index
+
+
+def _update_index(changes):
+    for pipeline_id, pipeline_data in changes.items():
+        if pipeline_data is None:
+            _index.discard(pipeline_id)
+        else:
+            _index.add(pipeline_id)
+    with _job_index_lock:
+        if _job_index is not None:
+            for pipeline_id, pipeline_data in changes.items():
+                _set_job_name(
+                    pipeline_id, _get_job_name(pipeline_data),
+                    _job_index, _job_names)
+
+
+async def arefresh():
+    """Reloads the DB content if it has been changed by another process.
+
+    Only the file backend is checked (through a cheap stat() call): the
+    other backends are not expected to be modified by other processes while
+    the server runs.
+    """
+    if DB_BACKEND == 'file' and backend.is_stale():
+        await _run_in_executor(backend.load)
+
+
+def get_ids(after=None):
+    """Returns the sorted IDs of the pipelines in the DB, without any I/O.
+
+    :param after: Only return the IDs that sort after this one
+    """
+    return sorted([
+        pipeline_id for pipeline_id in list(_index)
+        if after is None or pipeline_id > after
+    ])
+
+
+def exists(pipeline_id):
+    """Checks whether the pipeline is in the DB, without any I/O.
+
+    :param pipeline_id: ID of the pipeline
+    """
+    return pipeline_id in _index
+
+
+def load_content():
+    """Returns the whole DB content.
+
+    The returned dict is shared: callers must not modify it, but use the
+    astore(), aupdate(), adelete() or store_content() functions instead.
+    """
+    return backend.load()
+
+
+async def aload(pipeline_id=None):
+    """Returns the pipeline data, or the whole DB content if no ID is given.
+
+    The blocking I/O runs in an executor. As with load_content(), the
+    returned data must not be modified. None is returned for unknown IDs.
+
+    :param pipeline_id: ID of the pipeline
+    """
+    if pipeline_id is None:
+        return await _run_in_executor(backend.load)
+    return await _run_in_executor(backend.get, pipeline_id)
+
+
+async def aget_ids_by_job(job_name):
+    """Returns the IDs of the pipelines that use the given Jenkins job.
+
+    :param job_name: job name including folder/s, name & branch
+    """
+    await arefresh()
+    if _job_index is None:
+        await _run_in_executor(_build_job_index)
+    with _job_index_lock:
+        return sorted(_job_index.get(job_name, []))
+
+
+async def aload_many(pipeline_ids):
+    """Returns a list of (pipeline_id, data) tuples for the given IDs.
+
+    Data is None for the IDs not found in the DB.
+
+    :param pipeline_ids: List of pipeline IDs
+    """
+    if not pipeline_ids:
+        return []
+    return await _run_in_executor(backend.get_many, pipeline_ids)
+
+
+async def astore(pipeline_id, data):
+    """Stores the pipeline data, once the change is committed."""
+    await writer.submit('put', pipeline_id, data)
+    logger.debug('Pipeline <%s> stored in DB' % pipeline_id)
+
+
+async def aupdate(pipeline_id, data, if_match=None):
+    """Sets the given top-level keys of the pipeline data.
+
+    The keys are merged into the pipeline data at commit time, so
+    concurrent updates of different keys are not lost. With if_match, the
+    update is only applied if the given top-level keys still hold the given
+    values at commit time.
+    """
+    await writer.submit('update', pipeline_id, data, if_match=if_match)
+    logger.debug('Pipeline <%s> updated in DB: %s' % (pipeline_id, list(data)))
+
+
+async def adelete(pipeline_id):
+    """Deletes the pipeline, once the change is committed."""
+    await writer.submit('delete', pipeline_id)
+    logger.debug('Pipeline <%s> deleted from DB' % pipeline_id)
+
+
+def store_content(data):
+    backend.store(data)
+    _reset_index(data)
+    print_content(data)
+
+
+def import_content(db_file):
+    """Imports the pipelines from a JSON DB file into the current backend.
+
+    Pipelines already present in the current backend are kept, unless they
+    are also defined in the imported file. Only the imported pipelines are
+    written, so the pipelines stored meanwhile by a running server (other
+    than with the 'journal' backend) are not lost.
+
+    :param db_file: Path to the JSON file to import
+    """
+    imported = json.loads(pathlib.Path(db_file).read_text(encoding='utf-8'))
+    backend.apply(imported)
+    print_content(backend.load())
+    logger.info('%s pipelines imported from <%s>' % (len(imported), db_file))
 
 
-def print_content():
-    db = load_content()
-    logger.debug('Current DB content: %s' % list(db))
+def print_content(data):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Current DB content: %s' % list(data))
@@ -1,4 +1,7 @@
+import asyncio
+import hmac
 import io
+import json
 import logging
 import time
 import uuid
@@ -12,34 +15,245 @@ from openapi_server import config
 from openapi_server.models.pipeline import Pipeline
 from openapi_server import util
 from openapi_server.controllers import db
+from openapi_server.controllers import metrics
+from openapi_server.controllers import operations
+from openapi_server.controllers.cache import TTLCache
 from openapi_server.controllers.github import GitHubUtils
 from openapi_server.controllers.jepl import JePLUtils
 from openapi_server.controllers.jenkins import JenkinsUtils
 from openapi_server.controllers import utils as ctls_utils
 from openapi_server.models.inline_object import InlineObject
 
+from jenkins import JenkinsException
+
 
 TOKEN_GH_FILE = config.get_repo(
     'token', fallback='/etc/sqaaas/.gh_token')
 GITHUB_ORG = config.get_repo('organization')
+GITHUB_CACHE_TTL = int(config.get_repo('cache_ttl', fallback=300))
+GITHUB_CACHE_SIZE = int(config.get_repo('cache_size', fallback=256))
+GITHUB_RATELIMIT_BURST = int(config.get_repo('ratelimit_burst', fallback=100))
+GITHUB_RATELIMIT_RESERVE = int(config.get_repo('ratelimit_reserve', fallback=100))
+GITHUB_RATELIMIT_MAX_WAIT = float(config.get_repo('ratelimit_max_wait', fallback=60))
 
 TOKEN_JK_FILE = config.get_ci(
     'token', fallback='/etc/sqaaas/.jk_token')
 JENKINS_URL = config.get_ci('url')
 JENKINS_USER = config.get_ci('user')
 JENKINS_GITHUB_ORG = config.get_ci('github_organization_name')
+JENKINS_QUEUE_POLL_MIN = float(config.get_ci('queue_poll_min', fallback=0.25))
+JENKINS_QUEUE_POLL_MAX = float(config.get_ci('queue_poll_max', fallback=15))
+JENKINS_QUEUE_TIMEOUT = float(config.get_ci('queue_timeout', fallback=3600))
+JENKINS_SCAN_ORG_WINDOW = float(config.get_ci('scan_org_window', fallback=5))
+JENKINS_SCAN_ORG_TIMEOUT = float(config.get_ci('scan_org_timeout', fallback=600))
+JENKINS_EVENTS_TOKEN = config.get_ci('events_token', fallback=None)
+JENKINS_STATUS_FROM_EVENTS = config.get_ci(
+    'status_from_events', fallback='false').lower() in ['true', 'yes', '1']
+
+UPSTREAM_WORKERS = int(config.get('upstream_workers', fallback=10))
+UPSTREAM_CACHE_TTL = float(config.get('upstream_cache_ttl', fallback=0))
 
 logger = logging.getLogger('sqaaas_api.controller')
 
+if JENKINS_STATUS_FROM_EVENTS and not JENKINS_EVENTS_TOKEN:
+    logger.warning('CI events are disabled (no events_token set): status_from_events ignored')
+    JENKINS_STATUS_FROM_EVENTS = False
+
 with open(TOKEN_GH_FILE,'r') as f:
     token = f.read().strip()
 logger.debug('Loading GitHub token from local filesystem')
-gh_utils = GitHubUtils(token)
+upstream_executor = ctls_utils.UpstreamExecutor('upstream', UPSTREAM_WORKERS)
+github_utils = GitHubUtils(
+    token,
+    cache_ttl=GITHUB_CACHE_TTL,
+    cache_size=GITHUB_CACHE_SIZE,
+    ratelimit_burst=GITHUB_RATELIMIT_BURST,
+    ratelimit_reserve=GITHUB_RATELIMIT_RESERVE,
+    ratelimit_max_wait=GITHUB_RATELIMIT_MAX_WAIT)
+gh_utils = ctls_utils.ThreadedUtils(
+    github_utils,
+    upstream_executor,
+    shared_methods=['get_org_repository', 'get_repo_content', 'get_repository'],
+    cache_ttl=UPSTREAM_CACHE_TTL,
+    acquire_turn=github_utils.acquire_turn)
 
 with open(TOKEN_JK_FILE,'r') as f:
     jk_token = f.read().strip()
 logger.debug('Loading Jenkins token from local filesystem')
-jk_utils = JenkinsUtils(JENKINS_URL, JENKINS_USER, jk_token)
+jk_utils = ctls_utils.ThreadedUtils(
+    JenkinsUtils(
+        JENKINS_URL,
+        JENKINS_USER,
+        jk_token),
+    upstream_executor,
+    shared_methods=[
+        'exist_job', 'get_build_status', 'get_job_info', 'get_queue_item'],
+    read_methods=['get_build_statuses'],
+    # Polled until a build starts, so their results are never reused
+    polled_methods=['get_job_info', 'get_queue_item'],
+    cache_ttl=UPSTREAM_CACHE_TTL)
+
+# Number of pipelines loaded from the DB at once when listing them
+PIPELINES_CHUNK_SIZE = 100
+# Time (seconds) after which an idle status stream gets a keepalive comment
+STATUS_STREAM_KEEPALIVE = 15
+# Build results that do not change anymore, so they are stored in the DB
+JENKINS_FINAL_BUILD_RESULTS = [
+    'SUCCESS', 'FAILURE', 'ABORTED', 'UNSTABLE', 'NOT_BUILT']
+# Time (seconds) the build results notified through CI events are kept,
+# for the builds that are not stored in the DB yet
+CI_EVENTS_TTL = 600
+
+
+async def _scan_organization():
+    await jk_utils.scan_organization(org_name=JENKINS_GITHUB_ORG)
+
+
+async def _get_job_info(job_name):
+    return await jk_utils.get_job_info(job_name)
+
+
+# Scan requests within the same window are merged into a single scan
+scan_organization = ctls_utils.CoalescedCall(
+    _scan_organization, JENKINS_SCAN_ORG_WINDOW)
+# Jobs created by a scan are discovered by a single shared watcher
+job_watcher = ctls_utils.JobWatcher(
+    _get_job_info, timeout=JENKINS_SCAN_ORG_TIMEOUT)
+# IDs of the pipelines waiting for their job to be created
+_waiting_pipelines = set()
+# Final build results notified through CI events, by (job name, build no)
+_ci_build_results = TTLCache(CI_EVENTS_TTL, 1024)
+
+
+async def _set_job_build(pipeline_id, jk_job_name, build):
+    """Stores the first build of a job created by an organization scan.
+
+    Nothing is stored if the pipeline is no longer waiting for the job.
+    """
+    pipeline = await db.aload(pipeline_id)
+    if not pipeline:
+        return
+    jenkins_info = pipeline['jenkins']
+    if not jenkins_info['scan_org_wait'] or jenkins_info['job_name'] != jk_job_name:
+        return
+    logger.info('Jenkins job build URL (after Scan Organization finished) obtained: %s' % build['url'])
+    build_jenkins_info = {
+        'job_name': jk_job_name,
+        'build_info': {
+            'url': build['url'],
+            'number': build['number'],
+        },
+        'scan_org_wait': False,
+    }
+    await db.aupdate(
+        pipeline_id,
+        {'jenkins': build_jenkins_info},
+        if_match={'jenkins': jenkins_info})
+    await _store_notified_build_result(pipeline_id, build_jenkins_info)
+
+
+async def _wait_for_job(pipeline_id, jk_job_name):
+    """Stores the build of the pipeline's job once it is created."""
+    try:
+        last_build = await job_watcher.watch(jk_job_name)
+        if last_build:
+            await _set_job_build(pipeline_id, jk_job_name, last_build)
+            status_broadcaster.refresh(pipeline_id)
+    finally:
+        _waiting_pipelines.discard(pipeline_id)
+
+
+async def _store_build_result(pipeline_id, jenkins_info, build_result):
+    """Stores the result of the pipeline's build once it is final.
+
+    The result is not stored if the pipeline has been run again meanwhile.
+    """
+    if build_result not in JENKINS_FINAL_BUILD_RESULTS:
+        return
+    build_info = dict(jenkins_info['build_info'], result=build_result)
+    await db.aupdate(
+        pipeline_id,
+        {'jenkins': dict(jenkins_info, build_info=build_info)},
+        if_match={'jenkins': jenkins_info})
+    logger.debug('Final build result <%s> stored for pipeline <%s>' % (
+        build_result, pipeline_id))
+
+
+async def _store_notified_build_result(pipeline_id, jenkins_info):
+    """Stores the build result already notified through a CI event, if any.
+
+    A build can finish (and be notified) before it is stored in the DB,
+    e.g. while its queue item is polled. This must be called once the build
+    is stored: later events are matched with the DB content.
+
+    :param pipeline_id: ID of the pipeline
+    :param jenkins_info: Jenkins data just stored for the pipeline
+    """
+    build_no = jenkins_info['build_info']['number']
+    if not build_no:
+        return
+    build_result = _ci_build_results.get((jenkins_info['job_name'], build_no))
+    if build_result:
+        logger.debug('Using build result notified before the build was stored')
+        await _store_build_result(pipeline_id, jenkins_info, build_result)
+
+
+def _get_pending_run_status(jenkins_info):
+    """Returns the status of a pipeline run that has not triggered a build.
+
+    The status is None (not final) while the run operation is in progress,
+    and NOT_BUILT once the operation has failed or is not known anymore
+    (e.g. after a server restart).
+    """
+    operation = operations.get(jenkins_info.get('operation_id'))
+    if operation and operation.status in ['PENDING', 'RUNNING']:
+        return None
+    return 'NOT_BUILT'
+
+
+async def _wait_for_build(jk_job_name, item_no):
+    """Waits until the queued build starts, returning its build data.
+
+    The queue is polled with an exponential backoff, from
+    JENKINS_QUEUE_POLL_MIN up to JENKINS_QUEUE_POLL_MAX seconds, without
+    holding any upstream worker in between. If the build has not started
+    after JENKINS_QUEUE_TIMEOUT seconds, the queue item is cancelled and
+    JenkinsException is raised.
+
+    :param jk_job_name: job name including folder/s, name & branch
+    :param item_no: Number of the queue item
+    """
+    start_time = time.monotonic()
+    deadline = start_time + JENKINS_QUEUE_TIMEOUT
+    sleep_time_seconds = JENKINS_QUEUE_POLL_MIN
+    queue_data = await jk_utils.get_queue_item(item_no)
+    while 'executable' not in list(queue_data):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            try:
+                await jk_utils.cancel_queue(item_no)
+            except JenkinsException:
+                logger.warning('Could not cancel queue item <%s>' % item_no)
+            raise JenkinsException(
+                'Job <%s> did not start within %s seconds [504]' % (
+                    jk_job_name, JENKINS_QUEUE_TIMEOUT))
+        sleep_time_seconds = min(sleep_time_seconds, remaining)
+        logger.debug('Waiting for job to start (sleeping %s seconds)..' % sleep_time_seconds)
+        await asyncio.sleep(sleep_time_seconds)
+        sleep_time_seconds = min(sleep_time_seconds * 2, JENKINS_QUEUE_POLL_MAX)
+        queue_data = await jk_utils.get_queue_item(item_no)
+    queue_wait = time.monotonic() - start_time
+    metrics.observe('jenkins_queue_wait_seconds', queue_wait)
+    logger.debug('Job <%s> started after %.2f seconds in the queue' % (
+        jk_job_name, queue_wait))
+
+    return queue_data['executable']
+
+
+def _watch_job(pipeline_id, jk_job_name):
+    if pipeline_id not in _waiting_pipelines:
+        _waiting_pipelines.add(pipeline_id)
+        asyncio.ensure_future(_wait_for_job(pipeline_id, jk_job_name))
 
 
 async def add_pipeline(request: web.Request, body) -> web.Response:
@@ -65,16 +279,15 @@ async def add_pipeline(request: web.Request, body) -> web.Response:
     logger.debug('Repository ID for pipeline name <%s>: %s' % (pipeline_name, pipeline_repo))
     logger.debug('Using GitHub repository name: %s' % pipeline_repo)
 
-    _db = db.load_content()
-    _db[pipeline_id] = {
+    await db.astore(pipeline_id, {
+        'name': pipeline_name,
         'pipeline_repo': pipeline_repo,
         'data': {
             'config_data': config_json,
             'composer_data': composer_json,
             'jenkinsfile': jenkinsfile_data
         }
-    }
-    db.store_content(_db)
+    })
 
     r = {'id': pipeline_id}
     return web.json_response(r, status=201)
@@ -88,27 +301,153 @@ async def delete_pipeline_by_id(request: web.Request, pipeline_id) -> web.Respon
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    pipeline_repo = _db[pipeline_id]['pipeline_repo']
-    jk_job_name = _db[pipeline_id]['jenkins']['job_name']
-    if gh_utils.get_repository(pipeline_repo):
-        gh_utils.delete_repo(pipeline_repo)
-    if jk_utils.exist_job(jk_job_name):
-        jk_utils.scan_organization()
-    _db.pop(pipeline_id)
+    pipeline = await db.aload(pipeline_id)
+    pipeline_repo = pipeline['pipeline_repo']
+    jk_job_name = pipeline.get('jenkins', {}).get('job_name')
+    if await gh_utils.get_repository(pipeline_repo):
+        await gh_utils.delete_repo(pipeline_repo)
+    if jk_job_name and await jk_utils.exist_job(jk_job_name):
+        # No need to wait for the scan, the job is removed from Jenkins by then
+        scan_organization.request()
+    await db.adelete(pipeline_id)
+    status_broadcaster.refresh(pipeline_id)
     logger.info('Pipeline <%s> removed from DB' % pipeline_id)
 
     return web.Response(status=204)
 
 
-async def get_pipelines(request: web.Request) -> web.Response:
+async def get_pipelines(request: web.Request, limit=None, cursor=None, fields=None) -> web.Response:
     """Gets pipeline IDs.
 
     Returns the list of IDs for the defined pipelines.
 
+    :param limit: Maximum number of pipelines to return
+    :type limit: int
+    :param cursor: ID of the last pipeline returned in the previous page
+    :type cursor: str
+    :param fields: Pipeline properties to return
+    :type fields: List[str]
+
     """
-    _db = db.load_content()
-    return web.json_response(_db, status=200)
+    await db.arefresh()
+    pipeline_ids = db.get_ids(after=cursor)
+    response = web.StreamResponse()
+    response.content_type = 'application/json'
+    if limit and len(pipeline_ids) > limit:
+        pipeline_ids = pipeline_ids[:limit]
+        response.headers['X-Next-Cursor'] = pipeline_ids[-1]
+    await response.prepare(request)
+
+    separator = ''
+    await response.write(b'{')
+    for i in range(0, len(pipeline_ids), PIPELINES_CHUNK_SIZE):
+        chunk = await db.aload_many(
+            pipeline_ids[i:i+PIPELINES_CHUNK_SIZE])
+        items = []
+        for pipeline_id, pipeline_data in chunk:
+            if pipeline_data is None:
+                continue
+            if fields:
+                pipeline_data = dict([
+                    (field, pipeline_data[field])
+                    for field in fields if field in pipeline_data
+                ])
+            items.append('%s: %s' % (
+                json.dumps(pipeline_id), json.dumps(pipeline_data)))
+        if items:
+            await response.write(
+                (separator + ', '.join(items)).encode('utf-8'))
+            separator = ', '
+    await response.write(b'}')
+
+    return response
+
+
+async def handle_ci_event(request: web.Request, body, token=None) -> web.Response:
+    """Handles a build notification sent by Jenkins.
+
+    Updates the build info of the pipelines that use the notified job. The
+    payload follows the format of the Jenkins Notification plugin. Events
+    are rejected unless a token is set in the configuration, since stored
+    final results are not checked with Jenkins again.
+
+    :param body: Build notification
+    :type body: dict | bytes
+    :param token: Token shared with Jenkins
+    :type token: str
+
+    """
+    if not JENKINS_EVENTS_TOKEN:
+        _reason = 'CI events are disabled (no events_token set)'
+        logger.warning(_reason)
+        return web.Response(status=403, reason=_reason)
+    # Compared as bytes, since compare_digest() rejects non-ASCII strings
+    if not hmac.compare_digest(
+            (token or '').encode('utf-8'),
+            JENKINS_EVENTS_TOKEN.encode('utf-8')):
+        _reason = 'Invalid token supplied for CI event'
+        logger.warning(_reason)
+        return web.Response(status=401, reason=_reason)
+    try:
+        jk_job_name = JenkinsUtils.get_job_name(body['url'])
+        build_phase = body['build']['phase']
+        build = {
+            'number': body['build'].get('number'),
+            'url': body['build'].get('full_url'),
+            'result': body['build'].get('status'),
+        }
+    except (KeyError, TypeError, AttributeError):
+        _reason = 'Invalid CI event supplied'
+        logger.warning(_reason)
+        return web.Response(status=400, reason=_reason)
+    logger.debug('CI event received for job <%s>: %s (build_no: %s)' % (
+        jk_job_name, build_phase, build['number']))
+
+    if build['number'] and build_phase in ['COMPLETED', 'FINALIZED'] and (
+            build['result'] in JENKINS_FINAL_BUILD_RESULTS):
+        _ci_build_results.set((jk_job_name, build['number']), build['result'])
+    if build['number']:
+        job_watcher.notify(jk_job_name, build)
+    for pipeline_id in await db.aget_ids_by_job(jk_job_name):
+        pipeline = await db.aload(pipeline_id)
+        if not pipeline:
+            continue
+        jenkins_info = pipeline['jenkins']
+        if jenkins_info['scan_org_wait']:
+            if build['number']:
+                await _set_job_build(pipeline_id, jk_job_name, build)
+        elif (jenkins_info['build_info']['number'] == build['number'] and
+                build_phase in ['COMPLETED', 'FINALIZED']):
+            await _store_build_result(pipeline_id, jenkins_info, build['result'])
+        status_broadcaster.refresh(pipeline_id)
+
+    return web.Response(status=204)
+
+
+async def get_metrics(request: web.Request) -> web.Response:
+    """Gets server metrics.
+
+    Returns the current values of the internal metrics of the server.
+
+    """
+    return web.json_response(metrics.get_all(), status=200)
+
+
+async def get_operation_by_id(request: web.Request, operation_id) -> web.Response:
+    """Get operation status.
+
+    Obtains the progress and the result of a background operation.
+
+    :param operation_id: ID of the operation to get
+    :type operation_id: str
+
+    """
+    operation = operations.get(operation_id)
+    if not operation:
+        _reason = 'Operation not found!: %s' % operation_id
+        logger.warning(_reason)
+        return web.Response(status=404, reason=_reason)
+    return web.json_response(operation.to_dict(), status=200)
 
 
 @ctls_utils.validate_request
@@ -119,8 +458,7 @@ async def get_pipeline_by_id(request: web.Request, pipeline_id) -> web.Response:
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    r = _db[pipeline_id]
+    r = await db.aload(pipeline_id)
     return web.json_response(r, status=200)
 
 
@@ -134,8 +472,8 @@ async def get_pipeline_composer(request: web.Request, pipeline_id) -> web.Respon
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    pipeline_data = _db[pipeline_id]['data']
+    pipeline = await db.aload(pipeline_id)
+    pipeline_data = pipeline['data']
     r = pipeline_data['composer_data']
     return web.json_response(r, status=200)
 
@@ -150,8 +488,8 @@ async def get_pipeline_config(request: web.Request, pipeline_id) -> web.Response
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    pipeline_data = _db[pipeline_id]['data']
+    pipeline = await db.aload(pipeline_id)
+    pipeline_data = pipeline['data']
     r = pipeline_data['config_data']
     return web.json_response(r, status=200)
 
@@ -166,8 +504,8 @@ async def get_pipeline_jenkinsfile(request: web.Request, pipeline_id) -> web.Res
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    pipeline_data = _db[pipeline_id]['data']
+    pipeline = await db.aload(pipeline_id)
+    pipeline_data = pipeline['data']
     r = pipeline_data['jenkinsfile']
     return web.json_response(r, status=200)
 
@@ -183,70 +521,218 @@ async def get_pipeline_status(request: web.Request, pipeline_id) -> web.Response
 
     """
     logger.debug('Loading pipeline <%s> from DB' % pipeline_id)
-    _db = db.load_content()
+    pipeline = await db.aload(pipeline_id)
+    r = await _get_pipeline_status(pipeline_id, pipeline)
+    return web.json_response(r, status=200)
+
+
+async def _get_pipeline_status(pipeline_id, pipeline):
+    """Returns the build URL and status of the given pipeline.
 
-    jenkins_info = _db[pipeline_id]['jenkins']
+    :param pipeline_id: ID of the pipeline
+    :param pipeline: Pipeline data, as stored in the DB
+    """
+    jenkins_info = dict(pipeline['jenkins'])
     jk_job_name = jenkins_info['job_name']
     build_url = jenkins_info['build_info']['url']
     build_no = jenkins_info['build_info']['number']
 
     if jenkins_info['scan_org_wait']:
         logger.debug('scan_org_wait still enabled for pipeline job: %s' % jk_job_name)
-        last_build_data = jk_utils.get_job_info(jk_job_name)
-        if last_build_data:
-            build_url = last_build_data['lastBuild']['url']
-            build_no = last_build_data['lastBuild']['number']
-            logger.info('Jenkins job build URL (after Scan Organization finished) obtained: %s' % build_url)
-            jenkins_info['build_info'] = {
-                'url': build_url,
-                'number': build_no,
-            }
-            jenkins_info['scan_org_wait'] = False
+        # The job watcher updates the pipeline once the job is created
+        _watch_job(pipeline_id, jk_job_name)
+        build_status = 'WAITING_SCAN_ORG'
+    elif not build_no:
+        logger.debug('Pipeline run has not triggered a build yet')
+        build_status = _get_pending_run_status(jenkins_info)
+    else:
+        build_status = jenkins_info['build_info'].get('result')
+        if build_status:
+            logger.debug('Using final build result stored in DB')
+        elif JENKINS_STATUS_FROM_EVENTS:
+            logger.debug('Build still running, result will be set by CI events')
         else:
-            logger.debug('Job still waiting for scan organization to end')
-            build_status = 'WAITING_SCAN_ORG'
-
-    if build_no:
-        build_status = jk_utils.get_build_status(
-            jk_job_name,
-            build_no
-        )
+            build_status = await jk_utils.get_build_status(
+                jk_job_name,
+                build_no
+            )
+            await _store_build_result(
+                pipeline_id, pipeline['jenkins'], build_status)
     logger.info('Build status <%s> for job: %s (build_no: %s)' % (build_status, jk_job_name, build_no))
 
-    r = {
+    return {
         'build_url': build_url,
         'build_status': build_status
     }
-    return web.json_response(r, status=200)
+
+
+async def _get_pipeline_stream_status(pipeline_id):
+    """Returns the status of the given pipeline, as sent in the stream.
+
+    Besides the build results, the status can be WAITING_SCAN_ORG, QUEUED
+    (not run yet, or run in progress with no build yet) or RUNNING. None is
+    returned if the pipeline does not exist anymore.
+
+    :param pipeline_id: ID of the pipeline
+    """
+    pipeline = await db.aload(pipeline_id)
+    if not pipeline:
+        return None
+    if 'jenkins' not in pipeline:
+        return {'build_url': None, 'build_status': 'QUEUED'}
+    r = await _get_pipeline_status(pipeline_id, pipeline)
+    if not r['build_status']:
+        if pipeline['jenkins']['build_info']['number']:
+            r['build_status'] = 'RUNNING'
+        else:
+            r['build_status'] = 'QUEUED'
+    return r
+
+
+def _is_final_stream_status(r):
+    return r is None or r['build_status'] in JENKINS_FINAL_BUILD_RESULTS
+
+
+# Pipeline status updates, shared by all the clients streaming them
+status_broadcaster = ctls_utils.Broadcaster(
+    _get_pipeline_stream_status, _is_final_stream_status)
 
 
 @ctls_utils.validate_request
-async def run_pipeline(request: web.Request, pipeline_id) -> web.Response:
-    """Runs pipeline.
+async def get_pipeline_status_stream(request: web.Request, pipeline_id) -> web.StreamResponse:
+    """Stream pipeline status.
 
-    Executes the given pipeline by means of the Jenkins API.
+    Sends a Server-Sent Event with the build URL and status in Jenkins for
+    the given pipeline every time the status changes, until the build
+    finishes.
 
     :param pipeline_id: ID of the pipeline to get
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    pipeline_repo = _db[pipeline_id]['pipeline_repo']
-    pipeline_data = _db[pipeline_id]['data']
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+    })
+    await response.prepare(request)
+    queue = status_broadcaster.subscribe(pipeline_id)
+    try:
+        while True:
+            try:
+                r = await asyncio.wait_for(queue.get(), STATUS_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Comment lines keep the connection alive through proxies
+                await response.write(b': keepalive\n\n')
+                continue
+            if r is None:
+                logger.debug('Pipeline <%s> removed, closing status stream' % pipeline_id)
+                break
+            await response.write(
+                ('event: status\ndata: %s\n\n' % json.dumps(r)).encode('utf-8'))
+            if _is_final_stream_status(r):
+                break
+    finally:
+        status_broadcaster.unsubscribe(pipeline_id, queue)
+    await response.write_eof()
+    return response
+
+
+async def get_pipeline_statuses(request: web.Request, body) -> web.Response:
+    """Get the status of several pipelines.
+
+    Obtains the build URL and status in Jenkins for the given pipelines,
+    using a single Jenkins request per job folder. Final build results
+    already stored in the DB are not requested again.
+
+    :param body: Object with the list of pipeline IDs
+    :type body: dict | bytes
+
+    """
+    pipeline_ids = list(dict.fromkeys(body['pipeline_ids']))
+    r = {}
+    pipeline_builds = {}
+    for pipeline_id, pipeline in await db.aload_many(pipeline_ids):
+        if not pipeline or 'jenkins' not in pipeline:
+            logger.debug('Pipeline <%s> not found or not run yet, skipping' % pipeline_id)
+            continue
+        jenkins_info = pipeline['jenkins']
+        jk_job_name = jenkins_info['job_name']
+        if jenkins_info['scan_org_wait']:
+            _watch_job(pipeline_id, jk_job_name)
+            r[pipeline_id] = {
+                'build_url': jenkins_info['build_info']['url'],
+                'build_status': 'WAITING_SCAN_ORG'
+            }
+        elif not jenkins_info['build_info']['number']:
+            r[pipeline_id] = {
+                'build_url': None,
+                'build_status': _get_pending_run_status(jenkins_info)
+            }
+        elif jenkins_info['build_info'].get('result'):
+            r[pipeline_id] = {
+                'build_url': jenkins_info['build_info']['url'],
+                'build_status': jenkins_info['build_info']['result']
+            }
+        elif JENKINS_STATUS_FROM_EVENTS:
+            r[pipeline_id] = {
+                'build_url': jenkins_info['build_info']['url'],
+                'build_status': None
+            }
+        else:
+            pipeline_builds[pipeline_id] = jenkins_info
+
+    if pipeline_builds:
+        try:
+            builds = await jk_utils.get_build_statuses(list(set([
+                (jenkins_info['job_name'], jenkins_info['build_info']['number'])
+                    for jenkins_info in pipeline_builds.values()
+            ])))
+        except JenkinsException as e:
+            return ctls_utils.upstream_502_response(
+                ctls_utils.get_upstream_error(e))
+        for pipeline_id, jenkins_info in pipeline_builds.items():
+            build = builds.get((
+                jenkins_info['job_name'],
+                jenkins_info['build_info']['number'])) or {}
+            r[pipeline_id] = {
+                'build_url': jenkins_info['build_info']['url'],
+                'build_status': build.get('result')
+            }
+        await asyncio.gather(*[
+            _store_build_result(
+                pipeline_id, jenkins_info, r[pipeline_id]['build_status'])
+                for pipeline_id, jenkins_info in pipeline_builds.items()
+        ])
+    logger.info('Build status obtained for %s pipelines' % len(r))
+
+    return web.json_response(r, status=200)
+
+
+async def _run_pipeline(operation):
+    """Creates the pipeline repository and triggers the Jenkins build.
+
+    :param operation: Operation object that tracks the progress
+    """
+    pipeline_id = operation.pipeline_id
+    pipeline = await db.aload(pipeline_id)
+    pipeline_repo = pipeline['pipeline_repo']
+    pipeline_data = pipeline['data']
     logger.debug('Loading pipeline <%s> from DB' % pipeline_id)
 
-    repo_data = gh_utils.get_repository(pipeline_repo)
+    operation.set_step('CREATE_REPOSITORY')
+    repo_data = await gh_utils.get_repository(pipeline_repo)
     if repo_data:
         logger.warning('Repository <%s> already exists!' % repo_data['full_name'])
     else:
-        gh_utils.create_org_repository(pipeline_repo)
-    ctls_utils.push_jepl_files(
+        await gh_utils.create_org_repository(pipeline_repo)
+    operation.set_step('PUSH_JEPL_FILES')
+    await ctls_utils.push_jepl_files(
         gh_utils,
         pipeline_repo,
         pipeline_data['config_data'],
         pipeline_data['composer_data'],
         pipeline_data['jenkinsfile'])
-    repo_data = gh_utils.get_repository(pipeline_repo)
+    repo_data = await gh_utils.get_repository(pipeline_repo)
 
     _pipeline_repo_name = pipeline_repo.split('/')[-1]
     jk_job_name = '/'.join([
@@ -254,7 +740,7 @@ async def run_pipeline(request: web.Request, pipeline_id) -> web.Response:
         _pipeline_repo_name,
         repo_data['default_branch']
     ])
-    _db[pipeline_id]['jenkins'] = {
+    jenkins_info = {
         'job_name': jk_job_name,
         'build_info': {
             'number': None,
@@ -263,26 +749,77 @@ async def run_pipeline(request: web.Request, pipeline_id) -> web.Response:
         'scan_org_wait': False
     }
 
-    _status = 200
-    if jk_utils.exist_job(jk_job_name):
+    if await jk_utils.exist_job(jk_job_name):
         logger.warning('Jenkins job <%s> already exists!' % jk_job_name)
-        last_build_data = jk_utils.build_job(jk_job_name)
+        operation.set_step('TRIGGER_BUILD')
+        item_no = await jk_utils.build_job(jk_job_name)
+        operation.set_step('WAIT_BUILD_START')
+        last_build_data = await _wait_for_build(jk_job_name, item_no)
         build_no = last_build_data['number']
         build_url = last_build_data['url']
         logger.info('Jenkins job build URL obtained for repository <%s>: %s' % (pipeline_repo, build_url))
-        _db[pipeline_id]['jenkins']['build_info'] = {
+        jenkins_info['build_info'] = {
             'number': build_no,
             'url': build_url
         }
     else:
-        jk_utils.scan_organization()
-        _db[pipeline_id]['jenkins']['scan_org_wait'] = True
-        _status = 204
+        operation.set_step('INDEX_REPOSITORY')
+        if not await jk_utils.index_repository(
+                _pipeline_repo_name, org_name=JENKINS_GITHUB_ORG):
+            operation.set_step('SCAN_ORGANIZATION')
+            await scan_organization()
+        jenkins_info['scan_org_wait'] = True
+
+    await db.aupdate(pipeline_id, {'jenkins': jenkins_info})
+    await _store_notified_build_result(pipeline_id, jenkins_info)
+    if jenkins_info['scan_org_wait']:
+        _watch_job(pipeline_id, jk_job_name)
+
+    return {
+        'build_url': jenkins_info['build_info']['url'],
+        'scan_org_wait': jenkins_info['scan_org_wait']
+    }
+
 
-    db.store_content(_db)
+async def _run_pipeline_operation(operation):
+    try:
+        return await _run_pipeline(operation)
+    finally:
+        # Status streams get the outcome straight away, even on failure
+        status_broadcaster.refresh(operation.pipeline_id)
+
+
+@ctls_utils.validate_request
+async def run_pipeline(request: web.Request, pipeline_id) -> web.Response:
+    """Runs pipeline.
+
+    Executes the given pipeline by means of the Jenkins API.
+
+    :param pipeline_id: ID of the pipeline to get
+    :type pipeline_id: str
+
+    """
+    pipeline = await db.aload(pipeline_id)
+    operation = operations.start(pipeline_id, _run_pipeline_operation)
+    logger.info('Running pipeline <%s> (operation: %s)' % (pipeline_id, operation.id))
+    # Replaces the previous build, so it is not reported as the result of
+    # this run. The update is queued before any change made by the
+    # operation, which has not started yet.
+    await db.aupdate(pipeline_id, {
+        'jenkins': {
+            'job_name': pipeline.get('jenkins', {}).get('job_name'),
+            'build_info': {
+                'number': None,
+                'url': None,
+            },
+            'scan_org_wait': False,
+            'operation_id': operation.id
+        }
+    })
+    status_broadcaster.refresh(pipeline_id)
 
-    r = {'build_url': _db[pipeline_id]['jenkins']['build_info']['url']}
-    return web.json_response(r, status=_status)
+    r = {'operation_id': operation.id}
+    return web.json_response(r, status=202)
 
 
 @ctls_utils.validate_request
@@ -303,12 +840,12 @@ async def create_pull_request(request: web.Request, pipeline_id, body) -> web.Re
     logger.debug('Upstream repository path: %s' % upstream_repo)
 
     # step 1: create the fork
-    fork_repo, fork_default_branch = gh_utils.create_fork(upstream_repo)
+    fork_repo, fork_default_branch = await gh_utils.create_fork(upstream_repo)
     logger.debug('Using fork default branch: %s' % fork_default_branch)
     # step 2: push JePL files to fork
-    _db = db.load_content()
-    pipeline_data = _db[pipeline_id]['data']
-    ctls_utils.push_jepl_files(
+    pipeline = await db.aload(pipeline_id)
+    pipeline_data = pipeline['data']
+    await ctls_utils.push_jepl_files(
         gh_utils,
         fork_repo,
         pipeline_data['config_data'],
@@ -316,7 +853,7 @@ async def create_pull_request(request: web.Request, pipeline_id, body) -> web.Re
         pipeline_data['jenkinsfile'],
         branch=fork_default_branch)
     # step 3: create PR
-    pr = gh_utils.create_pull_request(
+    pr = await gh_utils.create_pull_request(
         upstream_repo,
         fork_repo,
         branch=fork_default_branch)
@@ -336,8 +873,8 @@ async def get_compressed_files(request: web.Request, pipeline_id) -> web.Respons
     :type pipeline_id: str
 
     """
-    _db = db.load_content()
-    pipeline_data = _db[pipeline_id]['data']
+    pipeline = await db.aload(pipeline_id)
+    pipeline_data = pipeline['data']
 
     config_yml, composer_yml, jenkinsfile = ctls_utils.get_jepl_files(
         pipeline_data['config_data'],
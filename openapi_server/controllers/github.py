@@ -1,39 +1,237 @@
+import hashlib
 import logging
+import threading
+import time
 
 from github import Github
+from github import InputGitTreeElement
 from github.GithubException import GithubException
+from github.GithubException import RateLimitExceededException
 from github.GithubException import UnknownObjectException
 
+from openapi_server.controllers import metrics
+from openapi_server.controllers.cache import TTLCache
+
+
+def get_blob_sha(file_data):
+    """Returns the SHA that git assigns to a blob with the given content.
+
+    :param file_data: File content (str or bytes)
+    """
+    if isinstance(file_data, str):
+        file_data = file_data.encode('utf-8')
+    header = b'blob %d\0' % len(file_data)
+    return hashlib.sha1(header + file_data).hexdigest()
+
+
+class RateLimiter(object):
+    """Token bucket that paces the requests to the GitHub API.
+
+    The bucket is refilled at the rate that spreads the remaining quota
+    (X-RateLimit-Remaining) until the quota reset time (X-RateLimit-Reset).
+    Non-urgent requests do not use the last 'reserve' requests of the quota.
+    """
+    def __init__(self, client, burst=100, reserve=100, max_wait=60):
+        """RateLimiter object definition.
+
+        :param client: github.Github object
+        :param burst: Maximum number of requests sent without pacing
+        :param reserve: Requests of the quota kept for urgent requests
+        :param max_wait: Maximum time (seconds) a request waits for its turn
+        """
+        self.client = client
+        self.burst = burst
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.remaining = None
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('sqaaas_api.github')
+
+        metrics.register_gauge(
+            'github_ratelimit_remaining', lambda: self.remaining)
+
+    def acquire(self, urgent=True):
+        """Takes the turn of a request to the GitHub API.
+
+        Returns the time (seconds) to wait before sending the request. The
+        caller does the wait, so that no thread is held meanwhile.
+        RateLimitExceededException is raised when the wait would exceed
+        max_wait seconds. The first call may request the rate limit status
+        to GitHub.
+
+        :param urgent: Whether the request can use the reserved quota
+        """
+        with self._lock:
+            self.remaining, limit = self.client.rate_limiting
+            window = max(self.client.rate_limiting_resettime - time.time(), 1)
+            available = self.remaining
+            if not urgent:
+                available -= self.reserve
+            now = time.monotonic()
+            rate = max(available, 0) / window
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * rate)
+            self._last = now
+            # The reserved quota is never used for non-urgent requests, even
+            # with tokens left in the bucket
+            if self._tokens >= 1 and (urgent or available >= 1):
+                wait = 0
+            elif rate > 0:
+                wait = (1 - self._tokens) / rate
+            else:
+                wait = window
+            if wait > self.max_wait:
+                raise RateLimitExceededException(
+                    403,
+                    {'message': 'GitHub API rate limit would be exceeded (reset in %d seconds)' % window},
+                    None)
+            self._tokens -= 1
+        if wait:
+            self.logger.debug('Pacing GitHub API request (waiting %.2f seconds, %s requests remaining)' % (
+                wait, self.remaining))
+        return wait
+
+
+def rate_limited(urgent=True):
+    """Decorator that marks the GitHubUtils methods paced by its RateLimiter.
+
+    The methods do not wait for their turn themselves: the caller must take
+    it through GitHubUtils.acquire_turn() and wait before the call
+    (ThreadedUtils does so on the event loop).
+
+    :param urgent: Whether the method can use the reserved quota
+    """
+    def decorator(f):
+        f.rate_limit_urgent = urgent
+        return f
+    return decorator
+
 
 class GitHubUtils(object):
     """Class for handling requests to GitHub API.
 
     Support only for token-based access.
     """
-    def __init__(self, access_token):
+    def __init__(
+            self,
+            access_token,
+            cache_ttl=300,
+            cache_size=256,
+            ratelimit_burst=100,
+            ratelimit_reserve=100,
+            ratelimit_max_wait=60):
         """GitHubUtils object definition.
 
         :param access_token: GitHub's access token
+        :param cache_ttl: Time (seconds) the organization objects are cached,
+                          and after which the cached repository objects are
+                          revalidated
+        :param cache_size: Maximum number of cached objects (per type)
+        :param ratelimit_burst: Maximum number of requests sent without pacing
+        :param ratelimit_reserve: Requests of the quota kept for urgent calls
+        :param ratelimit_max_wait: Maximum time (seconds) a call waits for
+                                   its turn
         """
         self.client = Github(access_token)
+        self.rate_limiter = RateLimiter(
+            self.client,
+            burst=ratelimit_burst,
+            reserve=ratelimit_reserve,
+            max_wait=ratelimit_max_wait)
         self.logger = logging.getLogger('sqaaas_api.github')
+        self.cache_ttl = cache_ttl
+        self._repo_cache = TTLCache(None, cache_size)
+        self._org_cache = TTLCache(cache_ttl, cache_size)
+
+    def acquire_turn(self, method_name):
+        """Takes the turn of a call to the given method in the rate limiter.
+
+        Returns the time (seconds) to wait before making the call (0 for the
+        methods that are not rate limited).
+
+        :param method_name: Name of the GitHubUtils method
+        """
+        urgent = getattr(
+            getattr(self, method_name), 'rate_limit_urgent', None)
+        if urgent is None:
+            return 0
+        return self.rate_limiter.acquire(urgent=urgent)
+
+    def _revalidate(self, obj):
+        """Refresh a cached GitHub object through a conditional request.
 
+        The request carries the object's ETag (If-None-Match), so a 304 (Not
+        Modified) response does not count against the API rate limit.
+
+        :param obj: PyGithub object (e.g. Repository)
+        """
+        if obj.update():
+            self.logger.debug('Cached object <%s> has changed, refreshed' % obj.url)
+        else:
+            self.logger.debug('Cached object <%s> not modified' % obj.url)
+
+    def _get_repo(self, repo_name, revalidate=False):
+        """Return the (cached) Repository object of a GitHub repository.
+
+        Cached objects are only dropped when the cache is full, so that
+        their ETag can still be used for revalidation after cache_ttl.
+
+        :param repo_name: GitHub's repo name (including organization/user)
+        :param revalidate: Check with GitHub whether the cached object is
+                           up to date, if checked more than cache_ttl
+                           seconds ago
+        """
+        cache_key = repo_name.lower()
+        cached = self._repo_cache.get(cache_key)
+        if cached is None:
+            repo = self.client.get_repo(repo_name)
+            self._repo_cache.set(cache_key, (repo, time.monotonic()))
+            return repo
+        repo, checked_at = cached
+        if revalidate and time.monotonic() - checked_at > self.cache_ttl:
+            try:
+                self._revalidate(repo)
+            except UnknownObjectException as e:
+                self._repo_cache.invalidate(cache_key)
+                raise e
+            self._repo_cache.set(cache_key, (repo, time.monotonic()))
+        return repo
+
+    def _set_repo(self, repo):
+        self._repo_cache.set(repo.full_name.lower(), (repo, time.monotonic()))
+
+    def _get_org(self, org_name):
+        """Return the (cached) Organization object of a GitHub organization.
+
+        :param org_name: GitHub's organization name
+        """
+        org = self._org_cache.get(org_name.lower())
+        if org is None:
+            org = self.client.get_organization(org_name)
+            self._org_cache.set(org_name.lower(), org)
+        return org
+
+    @rate_limited()
     def get_org_repository(self, repo_name, org_name='eosc-synergy'):
-        org = self.client.get_organization(org_name)
+        org = self._get_org(org_name)
         try:
             return org.get_repo(repo_name)
         except UnknownObjectException:
             return False
 
+    @rate_limited()
     def get_repo_content(self, repo_name, file_name, branch):
-        repo = self.client.get_repo(repo_name)
+        repo = self._get_repo(repo_name)
         try:
             return repo.get_contents(file_name, ref=branch)
         except (UnknownObjectException, GithubException):
             return False
 
+    @rate_limited()
     def push_file(self, file_name, file_data, commit_msg, repo_name, branch='sqaaas'):
-        repo = self.client.get_repo(repo_name)
+        repo = self._get_repo(repo_name)
         contents = self.get_repo_content(repo_name, file_name, branch)
         if contents:
             self.logger.debug('File <%s> already exists in the repository, updating..' % file_name)
@@ -42,8 +240,98 @@ class GitHubUtils(object):
             self.logger.debug('File <%s> does not currently exist in the repository, creating..' % file_name)
             repo.create_file(file_name, commit_msg, file_data, branch=branch)
 
+    def _get_blob_shas(self, repo, tree_sha, file_names):
+        """Return the SHAs of the given files in a git tree (None if missing).
+
+        Only the trees of the folders in the files' paths are requested,
+        since the recursive tree of large repositories can be huge (and
+        truncated by GitHub).
+
+        :param repo: PyGithub Repository object
+        :param tree_sha: SHA of the root tree
+        :param file_names: File paths, relative to the root tree
+        """
+        folders = {}
+        shas = {}
+        for file_name in file_names:
+            path = file_name.split('/')
+            sha = tree_sha
+            for depth in range(len(path)):
+                folder = '/'.join(path[:depth])
+                if folder not in folders:
+                    folders[folder] = {}
+                    if sha:
+                        folders[folder] = dict([
+                            (element.path, element.sha)
+                                for element in repo.get_git_tree(sha).tree
+                        ])
+                sha = folders[folder].get(path[depth])
+            shas[file_name] = sha
+        return shas
+
+    @rate_limited()
+    def push_files(self, repo_name, files, commit_msg, branch='sqaaas'):
+        """Push a set of files to a GitHub repository in a single commit.
+
+        The commit is built through the Git Data API (trees, commits and
+        refs). Files whose content matches the one in the branch are left
+        out, and no commit is created if none of them changed. A missing
+        branch is created from the head of the default branch. In empty
+        repositories (where the Git Data API cannot be used), the first file
+        is committed through the contents API and the rest on top of it.
+
+        :param repo_name: GitHub's repo name (including organization/user)
+        :param files: dict with the file paths as keys and contents as values
+        :param commit_msg: Commit message
+        :param branch: Branch to push the files to
+        """
+        repo = self._get_repo(repo_name)
+        files = dict(files)
+        try:
+            ref = repo.get_git_ref('heads/%s' % branch)
+        except GithubException as e:
+            if e.status == 404:
+                self.logger.debug('Branch <%s> not found in repository <%s>, creating it from <%s>..' % (
+                    branch, repo_name, repo.default_branch))
+                default_ref = repo.get_git_ref('heads/%s' % repo.default_branch)
+                ref = repo.create_git_ref(
+                    'refs/heads/%s' % branch, default_ref.object.sha)
+            elif e.status == 409:
+                file_name = next(iter(files))
+                self.logger.debug('Repository <%s> is empty, creating file <%s> in branch <%s>..' % (
+                    repo_name, file_name, branch))
+                repo.create_file(
+                    file_name, commit_msg, files.pop(file_name), branch=branch)
+                if not files:
+                    return
+                ref = repo.get_git_ref('heads/%s' % branch)
+            else:
+                raise e
+        base_commit = repo.get_git_commit(ref.object.sha)
+        base_shas = self._get_blob_shas(
+            repo, base_commit.tree.sha, list(files))
+        changed_files = dict([
+            (file_name, file_data)
+                for file_name, file_data in files.items()
+                    if base_shas.get(file_name) != get_blob_sha(file_data)
+        ])
+        if not changed_files:
+            self.logger.debug('Files <%s> have not changed in repository <%s>, skipping push' % (
+                ', '.join(files), repo_name))
+            return
+        tree_elements = [
+            InputGitTreeElement(file_name, '100644', 'blob', content=file_data)
+                for file_name, file_data in changed_files.items()
+        ]
+        tree = repo.create_git_tree(tree_elements, base_commit.tree)
+        commit = repo.create_git_commit(commit_msg, tree, [base_commit])
+        ref.edit(commit.sha)
+        self.logger.debug('Files <%s> pushed to repository <%s> (commit: %s)' % (
+            ', '.join(changed_files), repo_name, commit.sha))
+
+    @rate_limited(urgent=False)
     def create_fork(self, upstream_repo_name, org_name='eosc-synergy'):
-        repo = self.client.get_repo(upstream_repo_name)
+        repo = self._get_repo(upstream_repo_name)
         fork = None
         fork_default_branch = 'sqaaas'
         upstream_org_name, repo_name = upstream_repo_name.split('/')
@@ -61,8 +349,9 @@ class GitHubUtils(object):
                     sha=_branch_source_obj.commit.sha)
             fork = repo
         else:
-            org = self.client.get_organization(org_name)
+            org = self._get_org(org_name)
             fork = org.create_fork(repo)
+            self._set_repo(fork)
             _fork_parent = fork.raw_data['parent']['owner']['login']
             if _fork_parent not in [upstream_org_name]:
                 self.logger.error('Repository (fork) already exists in <%s> organization. Removing..' % org_name)
@@ -73,8 +362,9 @@ class GitHubUtils(object):
 
         return (fork.raw_data['full_name'], fork_default_branch)
 
+    @rate_limited(urgent=False)
     def create_pull_request(self, upstream_repo_name, repo_name, branch, upstream_branch='master'):
-        repo = self.client.get_repo(upstream_repo_name)
+        repo = self._get_repo(upstream_repo_name)
         body = '''
         Add JePL folder structure via SQAaaS.
 
@@ -94,34 +384,39 @@ class GitHubUtils(object):
         self.logger.debug('Pull request successfully created: %s (head) -> %s (base)' % (head, upstream_branch))
         return pr.raw_data
 
+    @rate_limited()
     def get_repository(self, repo_name):
         """Return raw data from a GitHub repository.
 
         :param repo_name: GitHub's repo name (including organization/user)
         """
         try:
-            repo = self.client.get_repo(repo_name)
+            repo = self._get_repo(repo_name, revalidate=True)
             self.logger.debug('Repository <%s> found' % repo_name)
             return repo.raw_data
         except UnknownObjectException:
             self.logger.debug('Repository <%s> not found!' % repo_name)
             return False
 
+    @rate_limited()
     def create_org_repository(self, repo_name):
         _org_name, _repo_name = repo_name.split('/')
         if not self.get_org_repository(repo_name):
-            org = self.client.get_organization(_org_name)
+            org = self._get_org(_org_name)
             repo = org.create_repo(_repo_name)
+            self._set_repo(repo)
             self.logger.debug('GitHub repository <%s> does not exist, creating..' % repo_name)
         else:
             self.logger.debug('GitHub repository <%s> already exists' % repo_name)
 
+    @rate_limited()
     def delete_repo(self, repo_name):
         """Delete a GitHub repository.
 
         :param repo_name: GitHub's repo name (including organization/user)
         """
-        repo = self.client.get_repo(repo_name)
+        repo = self._get_repo(repo_name)
         self.logger.debug('Deleting repository: %s' % repo_name)
         repo.delete()
+        self._repo_cache.invalidate(repo_name.lower())
         self.logger.debug('Repository <%s> successfully deleted' % repo_name)
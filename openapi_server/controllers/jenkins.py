@@ -1,8 +1,10 @@
 import logging
 import requests
-import time
 
+from urllib.parse import quote
+from urllib.parse import unquote
 from urllib.parse import urljoin
+from urllib.parse import urlparse
 
 import jenkins
 
@@ -28,6 +30,19 @@ class JenkinsUtils(object):
             password = self.access_token)
         self.logger = logging.getLogger('sqaaas_api.jenkins')
 
+    @staticmethod
+    def get_job_name(job_url):
+        """Return the full job name from a job URL (or URL path).
+
+        e.g. 'job/my_org/job/my_repo/job/main/' -> 'my_org/my_repo/main'
+
+        :param job_url: Job URL, as in the Jenkins API responses
+        """
+        path = urlparse(job_url).path.strip('/').split('/')
+        return '/'.join([
+            unquote(path[i+1]) for i in range(len(path)-1) if path[i] == 'job'
+        ])
+
     def scan_organization(self, org_name='eosc-synergy-org'):
         path = '/job/%s/build?delay=0' % org_name
         r = requests.post(
@@ -36,6 +51,28 @@ class JenkinsUtils(object):
         r.raise_for_status()
         self.logger.debug('Triggered GitHub organization scan')
 
+    def index_repository(self, repo_name, org_name='eosc-synergy-org'):
+        """Trigger the branch indexing of a single repository.
+
+        Only the repository's multibranch job is indexed, instead of scanning
+        the whole GitHub organization. Returns False when the job does not
+        exist (yet) in Jenkins, so the organization has to be scanned instead.
+
+        :param repo_name: GitHub's repository name (without organization)
+        :param org_name: Name in Jenkins of the GitHub organization
+        """
+        job_name = '/'.join([org_name, repo_name])
+        if not self.server.job_exists(job_name):
+            self.logger.debug('Jenkins job <%s> does not exist, cannot be indexed' % job_name)
+            return False
+        path = '/job/%s/job/%s/build?delay=0' % (quote(org_name), quote(repo_name))
+        r = requests.post(
+            urljoin(self.endpoint, path),
+            auth=(self.access_user, self.access_token))
+        r.raise_for_status()
+        self.logger.debug('Triggered branch indexing of Jenkins job <%s>' % job_name)
+        return True
+
     def get_job_info(self, name, depth=0):
         job_info = {}
         try:
@@ -53,21 +90,79 @@ class JenkinsUtils(object):
         return self.get_job_info(job_name)
 
     def build_job(self, full_job_name):
+        """Triggers a job build, returning the number of its queue item.
+
+        The build data is obtained through get_queue_item() once the build
+        has left the queue.
+
+        :param full_job_name: job name including folder/s, name & branch
+        """
         item_no = self.server.build_job(full_job_name)
         self.logger.debug('Triggered job build (queue item number: %s)' % item_no)
-        queue_data = {}
-        sleep_time_seconds = 15
-        while 'executable' not in list(queue_data):
-            self.logger.debug('Waiting for job to start (sleeping %s seconds)..' % sleep_time_seconds)
-            time.sleep(sleep_time_seconds)
-            queue_data = self.server.get_queue_item(item_no)
+        return item_no
+
+    def get_queue_item(self, item_no):
+        """Return the data of a queue item.
+
+        The 'executable' key holds the build data once the build started.
+
+        :param item_no: Number of the queue item
+        """
+        return self.server.get_queue_item(item_no)
 
-        return queue_data['executable']
+    def cancel_queue(self, item_no):
+        self.logger.debug('Cancelling queue item <%s>' % item_no)
+        self.server.cancel_queue(item_no)
 
     def get_build_status(self, full_job_name, build_no):
         self.logger.debug('Getting status for job <%s> (build_no: %s)' % (full_job_name, build_no))
         return self.server.get_build_info(full_job_name, build_no)['result']
 
+    def get_build_statuses(self, builds, builds_per_job=5):
+        """Get the status of several builds, querying each folder once.
+
+        Only the number, result and URL of the last 'builds_per_job' builds
+        of each job are requested, through the 'tree' parameter. Builds not
+        found that way are requested one by one.
+
+        Returns a dict with the (full_job_name, build_no) tuples as keys and
+        the {'number', 'result', 'url'} dicts as values (None if the build
+        does not exist).
+
+        :param builds: list of (full_job_name, build_no) tuples, where job
+                       names follow the <folder>/<repo>/<branch> layout
+        :param builds_per_job: number of builds requested per job
+        """
+        statuses = {}
+        folders = set([full_job_name.split('/')[0] for full_job_name, build_no in builds])
+        tree = 'jobs[name,jobs[name,builds[number,result,url]{0,%s}]]' % builds_per_job
+        for folder in folders:
+            self.logger.debug('Getting build statuses for jobs in folder <%s>' % folder)
+            folder_info = self.server.get_info(
+                item='job/%s' % folder, query='?tree=%s' % tree)
+            for repo_job in folder_info.get('jobs', []):
+                for branch_job in repo_job.get('jobs', []):
+                    full_job_name = '/'.join([
+                        folder, repo_job['name'], branch_job['name']])
+                    for build in branch_job.get('builds', []):
+                        statuses[(full_job_name, build['number'])] = build
+
+        r = {}
+        for full_job_name, build_no in builds:
+            build = statuses.get((full_job_name, build_no))
+            if not build:
+                self.logger.debug('Build not found in folder info, getting it directly (job: %s, build_no: %s)' % (
+                    full_job_name, build_no))
+                try:
+                    build_info = self.server.get_build_info(full_job_name, build_no)
+                    build = dict([
+                        (k, build_info[k]) for k in ['number', 'result', 'url']])
+                except jenkins.JenkinsException:
+                    self.logger.error('No info could be fetched for Jenkins build <%s #%s>' % (
+                        full_job_name, build_no))
+            r[(full_job_name, build_no)] = build
+        return r
+
     def delete_job(self, full_job_name):
         self.logger.debug('Deleting Jenkins job: %s' % full_job_name)
         self.server.delete_job(full_job_name)
@@ -0,0 +1,69 @@
+import bisect
+import threading
+
+
+_gauges = {}
+_histograms = {}
+_lock = threading.Lock()
+
+# Default upper bounds (seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Histogram(object):
+    """Counts the observed values in buckets of increasing upper bounds."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Histogram object definition.
+
+        :param buckets: Sorted upper bounds of the buckets
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        buckets = {}
+        accum = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            accum += count
+            buckets[str(bound)] = accum
+        return {'buckets': buckets, 'count': self.count, 'sum': self.sum}
+
+
+def register_gauge(name, func):
+    """Registers a gauge whose value is obtained when the metrics are read.
+
+    :param name: Name of the metric
+    :param func: Function (no arguments) that returns the current value
+    """
+    _gauges[name] = func
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """Adds a value to the given histogram, creating it if needed.
+
+    :param name: Name of the metric
+    :param value: Observed value
+    :param buckets: Upper bounds of the buckets (only used on creation)
+    """
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(buckets)
+        _histograms[name].observe(value)
+
+
+def get_all():
+    """Returns the current value of all the metrics."""
+    r = {}
+    for name, func in list(_gauges.items()):
+        r[name] = func()
+    with _lock:
+        for name, histogram in _histograms.items():
+            r[name] = histogram.to_dict()
+    return r
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from openapi_server import config
+from openapi_server.controllers import utils as ctls_utils
+
+
+OPERATION_TTL = int(config.get('operation_ttl', fallback=3600))
+logger = logging.getLogger('sqaaas_api.controller.operations')
+
+_operations = {}
+
+
+class Operation(object):
+    """Tracks the progress of a task that runs in the background."""
+    def __init__(self, pipeline_id):
+        """Operation object definition.
+
+        :param pipeline_id: ID of the pipeline the operation works on
+        """
+        self.id = str(uuid.uuid4())
+        self.pipeline_id = pipeline_id
+        self.status = 'PENDING'
+        self.step = None
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self._task = None
+
+    def set_step(self, step):
+        self.step = step
+        logger.debug('Operation <%s> (pipeline: %s): %s' % (
+            self.id, self.pipeline_id, step))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'pipeline_id': self.pipeline_id,
+            'status': self.status,
+            'step': self.step,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+def _purge():
+    """Removes the operations finished more than OPERATION_TTL seconds ago."""
+    expired = time.time() - OPERATION_TTL
+    for operation_id, operation in list(_operations.items()):
+        if operation.finished_at and operation.finished_at < expired:
+            _operations.pop(operation_id)
+
+
+async def _run(operation, func):
+    operation.status = 'RUNNING'
+    try:
+        operation.result = await func(operation)
+    except Exception as e:
+        operation.status = 'FAILED'
+        operation.error = ctls_utils.get_upstream_error(e)
+        if not operation.error:
+            logger.exception('Operation <%s> failed' % operation.id)
+            operation.error = {'reason': str(e)}
+    else:
+        operation.status = 'SUCCEEDED'
+        logger.debug('Operation <%s> finished successfully' % operation.id)
+    operation.finished_at = time.time()
+
+
+def start(pipeline_id, func):
+    """Runs func(operation) as a background task.
+
+    Returns the Operation object that tracks its progress. The value
+    returned by func is set as the operation's result.
+
+    :param pipeline_id: ID of the pipeline the operation works on
+    :param func: Coroutine function that receives the Operation object
+    """
+    _purge()
+    operation = Operation(pipeline_id)
+    _operations[operation.id] = operation
+    operation._task = asyncio.ensure_future(_run(operation, func))
+    return operation
+
+
+def get(operation_id):
+    return _operations.get(operation_id)
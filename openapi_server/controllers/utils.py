@@ -1,11 +1,18 @@
+import asyncio
+import contextvars
+import copy
 import functools
 import logging
 import re
+import time
 import uuid
 
 from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor
 
 from openapi_server.controllers import db
+from openapi_server.controllers import metrics
+from openapi_server.controllers.cache import TTLCache
 from openapi_server.controllers.jepl import JePLUtils
 
 from github.GithubException import GithubException
@@ -23,14 +30,414 @@ def upstream_502_response(r):
         reason='Unsuccessful request to upstream service API')
 
 
+class UpstreamExecutor(object):
+    """Bounded thread pool for the blocking calls to upstream services.
+
+    Pool usage is exposed through the '<name>_pool_*' metrics.
+    """
+    def __init__(self, name, max_workers):
+        """UpstreamExecutor object definition.
+
+        :param name: Name of the pool, used as metrics prefix
+        :param max_workers: Maximum number of threads in the pool
+        """
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+
+        metrics.register_gauge(
+            '%s_pool_busy' % name, lambda: min(self._pending, self.max_workers))
+        metrics.register_gauge(
+            '%s_pool_queued' % name, lambda: max(self._pending - self.max_workers, 0))
+        metrics.register_gauge(
+            '%s_pool_saturation' % name, lambda: self._pending / self.max_workers)
+
+    async def run(self, func, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        self._pending += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                self._executor, functools.partial(ctx.run, func, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+
+class ThreadedUtils(object):
+    """Wraps a blocking API client so its methods run in an executor.
+
+    Every method of the wrapped object is returned as a coroutine function.
+    Concurrent calls to the read methods (shared_methods) with the same
+    arguments share a single upstream call, whose result can also be reused
+    for cache_ttl seconds (except for polled_methods, whose results must be
+    fresh). Calls to any method not listed as a read method (shared_methods
+    or read_methods) are considered writes and discard the reused results.
+    When the upstream API is rate limited (acquire_turn), calls wait for
+    their turn on the event loop, so that no thread is held meanwhile.
+    """
+    def __init__(
+            self,
+            utils,
+            executor,
+            shared_methods=(),
+            read_methods=(),
+            polled_methods=(),
+            cache_ttl=0,
+            cache_size=1024,
+            acquire_turn=None):
+        """ThreadedUtils object definition.
+
+        :param utils: Object (e.g. GitHubUtils) with blocking methods
+        :param executor: UpstreamExecutor object that runs the methods
+        :param shared_methods: Names of the read methods whose calls are shared
+        :param read_methods: Names of the other read methods
+        :param polled_methods: Names of the shared methods whose results are
+                               not reused once their call is done
+        :param cache_ttl: Time (seconds) the results of the read methods are
+                          reused (0 to disable)
+        :param cache_size: Maximum number of results kept
+        :param acquire_turn: Blocking function that returns the time (seconds)
+                             a call to the given method must wait for (e.g.
+                             GitHubUtils.acquire_turn)
+        """
+        self.utils = utils
+        self.executor = executor
+        self.shared_methods = shared_methods
+        self.read_methods = read_methods
+        self.polled_methods = polled_methods
+        self._cache = None
+        if cache_ttl:
+            self._cache = TTLCache(cache_ttl, cache_size)
+        self._in_flight = {}
+        self._generation = 0
+        self.acquire_turn = acquire_turn
+
+    def __getattr__(self, name):
+        attr = getattr(self.utils, name)
+        if not callable(attr):
+            return attr
+
+        if name in self.shared_methods:
+            @functools.wraps(attr)
+            async def run(*args, **kwargs):
+                return await self._run_shared(name, attr, args, kwargs)
+        elif name in self.read_methods:
+            @functools.wraps(attr)
+            async def run(*args, **kwargs):
+                return await self._call(name, attr, args, kwargs)
+        else:
+            @functools.wraps(attr)
+            async def run(*args, **kwargs):
+                self._invalidate()
+                try:
+                    return await self._call(name, attr, args, kwargs)
+                finally:
+                    self._invalidate()
+        return run
+
+    def _invalidate(self):
+        # Results of calls started before are neither reused nor cached
+        self._generation += 1
+        if self._cache is not None:
+            self._cache.clear()
+
+    async def _call(self, name, func, args, kwargs):
+        if self.acquire_turn is not None:
+            # Only the (short) rate limit check is run in the executor
+            wait = await self.executor.run(self.acquire_turn, name)
+            if wait:
+                await asyncio.sleep(wait)
+        return await self.executor.run(func, *args, **kwargs)
+
+    async def _run_shared(self, name, func, args, kwargs):
+        key = (self._generation, name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return await self._call(name, func, args, kwargs)
+        cached = self._cache is not None and name not in self.polled_methods
+        if cached:
+            r = self._cache.get(key)
+            if r is not None:
+                logger.debug('Reusing result of <%s> call' % name)
+                return r
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._call(name, func, args, kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(
+                functools.partial(self._done, key, cached))
+        else:
+            logger.debug('Sharing in-flight <%s> call' % name)
+        # The call goes on for the other callers if this one is cancelled
+        return await asyncio.shield(future)
+
+    def _done(self, key, cached, future):
+        self._in_flight.pop(key, None)
+        if future.cancelled() or future.exception():
+            return
+        if cached and key[0] == self._generation:
+            self._cache.set(key, future.result())
+
+
+class CoalescedCall(object):
+    """Merges the calls requested within a time window into a single call.
+
+    The call is made once the window (started by the first request) expires,
+    and its result is shared by all the requests. Requests received while
+    the call is in progress are served by the next call.
+    """
+    def __init__(self, func, window):
+        """CoalescedCall object definition.
+
+        :param func: Coroutine function (no arguments) to call
+        :param window: Time (seconds) the requests are gathered for
+        """
+        self.func = func
+        self.window = window
+        self._future = None
+        self._requests = 0
+
+    def request(self):
+        """Requests a call, returning the future of the shared call.
+
+        The future can be safely left unawaited, failures are logged.
+        """
+        if self._future is None:
+            self._future = asyncio.get_event_loop().create_future()
+            self._future.add_done_callback(self._log_failure)
+            asyncio.ensure_future(self._flush(self._future))
+        self._requests += 1
+        return self._future
+
+    async def __call__(self):
+        return await asyncio.shield(self.request())
+
+    def _log_failure(self, future):
+        if not future.cancelled() and future.exception():
+            logger.error('Coalesced call <%s> failed: %s' % (
+                self.func.__name__, future.exception()))
+
+    async def _flush(self, future):
+        await asyncio.sleep(self.window)
+        requests = self._requests
+        self._future = None
+        self._requests = 0
+        logger.debug('Running coalesced call <%s> (%s requests)' % (
+            self.func.__name__, requests))
+        try:
+            future.set_result(await self.func())
+        except Exception as e:
+            future.set_exception(e)
+
+
+class JobWatcher(object):
+    """Waits for Jenkins jobs to be created (e.g. by an organization scan).
+
+    All the watched jobs are checked by a single background task, whose
+    interval grows from interval_min to interval_max seconds. The future
+    returned by watch() is resolved with the job's last build once it shows
+    up, or with None after timeout seconds.
+    """
+    def __init__(self, get_job_info, interval_min=1, interval_max=30, timeout=600):
+        """JobWatcher object definition.
+
+        :param get_job_info: Coroutine function that returns the Jenkins
+                             job info (empty if the job does not exist)
+        :param interval_min: Initial interval (seconds) between checks
+        :param interval_max: Maximum interval (seconds) between checks
+        :param timeout: Time (seconds) a job is waited for
+        """
+        self.get_job_info = get_job_info
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.timeout = timeout
+        self._watched = {}
+        self._interval = interval_min
+        self._task = None
+
+    def watch(self, job_name):
+        """Returns the future of the given job, watching it if needed.
+
+        :param job_name: job name including folder/s, name & branch
+        """
+        if job_name not in self._watched:
+            future = asyncio.get_event_loop().create_future()
+            self._watched[job_name] = (future, time.monotonic() + self.timeout)
+            self._interval = self.interval_min
+            if self._task is None or self._task.done():
+                self._task = asyncio.ensure_future(self._run())
+        return self._watched[job_name][0]
+
+    def notify(self, job_name, last_build):
+        """Resolves the future of a watched job, which has been created.
+
+        :param job_name: job name including folder/s, name & branch
+        :param last_build: dict with the 'number' and 'url' of the build
+        """
+        if job_name in self._watched:
+            logger.debug('Jenkins job <%s> notified' % job_name)
+            future, deadline = self._watched.pop(job_name)
+            if not future.done():
+                future.set_result(last_build)
+
+    async def _check(self, job_name):
+        try:
+            job_info = await self.get_job_info(job_name)
+        except Exception as e:
+            logger.warning('Could not check Jenkins job <%s>: %s' % (job_name, e))
+            return None
+        if job_info:
+            return job_info.get('lastBuild')
+
+    async def _run(self):
+        while self._watched:
+            await asyncio.sleep(self._interval)
+            self._interval = min(self._interval * 2, self.interval_max)
+            for job_name, (future, deadline) in list(self._watched.items()):
+                last_build = await self._check(job_name)
+                if last_build:
+                    logger.debug('Jenkins job <%s> found' % job_name)
+                elif time.monotonic() > deadline:
+                    logger.warning('Jenkins job <%s> not found after %s seconds' % (
+                        job_name, self.timeout))
+                else:
+                    continue
+                # The job may have been notified meanwhile
+                self._watched.pop(job_name, None)
+                if not future.done():
+                    future.set_result(last_build)
+
+
+class Broadcaster(object):
+    """Shares the values obtained by polling among several subscribers.
+
+    A single background task per key polls func(key), while the key has
+    subscribers, and publishes every new value to their queues. Polling
+    stops once a final value (as per is_final) is published. The interval
+    grows from interval_min to interval_max seconds while the value does
+    not change, and refresh() forces an immediate poll.
+    """
+    def __init__(self, func, is_final, interval_min=1, interval_max=10):
+        """Broadcaster object definition.
+
+        :param func: Coroutine function that obtains the value of a key
+        :param is_final: Function that checks whether a value is final
+        :param interval_min: Initial interval (seconds) between polls
+        :param interval_max: Maximum interval (seconds) between polls
+        """
+        self.func = func
+        self.is_final = is_final
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self._subscribers = {}
+        self._values = {}
+        self._wakeups = {}
+
+    def subscribe(self, key):
+        """Returns the queue where the values of the key are published.
+
+        The queue gets the current value straight away, if known.
+        unsubscribe() must be called once the queue is not read anymore.
+        """
+        queue = asyncio.Queue()
+        if key in self._values:
+            queue.put_nowait(self._values[key])
+        if key not in self._subscribers:
+            self._subscribers[key] = set()
+            self._wakeups[key] = asyncio.Event()
+            asyncio.ensure_future(self._run(key))
+        self._subscribers[key].add(queue)
+        return queue
+
+    def unsubscribe(self, key, queue):
+        queues = self._subscribers.get(key, set())
+        queues.discard(queue)
+        if not queues:
+            self.refresh(key)
+
+    def refresh(self, key):
+        """Polls the key straight away, if it has subscribers."""
+        if key in self._wakeups:
+            self._wakeups[key].set()
+
+    async def _run(self, key):
+        interval = self.interval_min
+        wakeup = self._wakeups[key]
+        try:
+            while self._subscribers[key]:
+                wakeup.clear()
+                try:
+                    value = await self.func(key)
+                except Exception as e:
+                    logger.warning('Could not obtain value for <%s>: %s' % (key, e))
+                else:
+                    if key not in self._values or value != self._values[key]:
+                        self._values[key] = value
+                        interval = self.interval_min
+                        for queue in self._subscribers[key]:
+                            queue.put_nowait(value)
+                        if self.is_final(value):
+                            break
+                try:
+                    await asyncio.wait_for(wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    interval = min(interval * 2, self.interval_max)
+        finally:
+            del self._subscribers[key]
+            del self._wakeups[key]
+            self._values.pop(key, None)
+
+
+@web.middleware
+async def db_io_middleware(request, handler):
+    """Logs the amount of DB I/O bytes spent on each request."""
+    stats = db.start_io_stats()
+    try:
+        return await handler(request)
+    finally:
+        logger.debug('DB I/O for request <%s %s>: %s bytes read, %s bytes written' % (
+            request.method, request.path, stats['read'], stats['written']))
+
+
+def get_upstream_error(e):
+    """Returns the upstream status and reason of a GitHub/Jenkins exception.
+
+    None is returned for any other type of exception.
+
+    :param e: Exception raised by the upstream service client
+    """
+    if isinstance(e, UnknownObjectException):
+        _status = e.status
+        _reason = e.data['message']
+        logger.error('(GitHub) %s (exit code: %s)' % (_reason, _status))
+    elif isinstance(e, GithubException):
+        _status = e.status
+        # Some errors (e.g. rate limit) come without the 'errors' list
+        _reason = e.data.get('errors', [e.data])[0]['message']
+        logger.error('(GitHub) %s (exit code: %s)' % (_reason, _status))
+    elif isinstance(e, JenkinsException):
+        msg_first_line = str(e).splitlines()[0]
+        logger.error('(Jenkins) %s' % msg_first_line)
+        _reason = msg_first_line
+        _status = 404
+        _status_regexp = re.search('.+\[([45]0\d{1})\].*', _reason)
+        if _status_regexp:
+            _status = int(_status_regexp.groups()[0])
+    else:
+        return None
+    return {'upstream_status': _status, 'upstream_reason': _reason}
+
+
 def validate_request(f):
     @functools.wraps(f)
     async def decorated_function(*args, **kwargs):
         _pipeline_id = kwargs['pipeline_id']
         try:
             uuid.UUID(_pipeline_id, version=4)
-            _db = db.load_content()
-            if _pipeline_id in list(_db):
+            await db.arefresh()
+            if db.exists(_pipeline_id):
                 logger.debug('Pipeline <%s> found in DB' % _pipeline_id)
             else:
                 _reason = 'Pipeline not found!: %s' % _pipeline_id
@@ -43,33 +450,17 @@ def validate_request(f):
         try:
             logger.debug('Running decorated method <%s>' % f.__name__)
             ret = await f(*args, **kwargs)
-        except UnknownObjectException as e:
-            _status = e.status
-            _reason = e.data['message']
-            logger.error('(GitHub) %s (exit code: %s)' % (_reason, _status))
-            r = {'upstream_status': _status, 'upstream_reason': _reason}
-            return upstream_502_response(r)
-        except GithubException as e:
-            _status = e.status
-            _reason = e.data['errors'][0]['message']
-            logger.error('(GitHub) %s (exit code: %s)' % (_reason, _status))
-            r = {'upstream_status': _status, 'upstream_reason': _reason}
-            return upstream_502_response(r)
-        except JenkinsException as e:
-            msg_first_line = str(e).splitlines()[0]
-            logger.error('(Jenkins) %s' % msg_first_line)
-            _reason = msg_first_line
-            _status = 404
-            _status_regexp = re.search('.+\[(40\d{1})\].+', _reason)
-            if _status_regexp:
-                _status = int(_status_regexp.groups()[0])
-            r = {'upstream_status': _status, 'upstream_reason': _reason}
+        except (GithubException, JenkinsException) as e:
+            r = get_upstream_error(e)
             return upstream_502_response(r)
         return ret
     return decorated_function
 
 
 def get_jepl_files(config_json, composer_json, jenkinsfile):
+    # Work on copies, since DB content is shared and must not be modified
+    config_json = copy.deepcopy(config_json)
+    composer_json = copy.deepcopy(composer_json)
     # Docker Compose specific
     for srv_name, srv_data in composer_json['services'].items():
         ## Set JPL_DOCKER* envvars
@@ -101,15 +492,19 @@ def get_jepl_files(config_json, composer_json, jenkinsfile):
     return (config_yml, composer_yml, jenkinsfile)
 
 
-def push_jepl_files(gh_utils, repo, config_json, composer_json, jenkinsfile, branch='sqaaas'):
+async def push_jepl_files(gh_utils, repo, config_json, composer_json, jenkinsfile, branch='sqaaas'):
     config_yml, composer_yml, jenkinsfile = get_jepl_files(
         config_json,
         composer_json,
         jenkinsfile)
-    logger.debug('Pushing file to GitHub repository <%s>: .sqa/config.yml' % repo)
-    gh_utils.push_file('.sqa/config.yml', config_yml, 'Update config.yml', repo, branch=branch)
-    logger.debug('Pushing file to GitHub repository <%s>: .sqa/docker-compose.yml' % repo)
-    gh_utils.push_file('.sqa/docker-compose.yml', composer_yml, 'Update docker-compose.yml', repo, branch=branch)
-    logger.debug('Pushing file to GitHub repository <%s>: Jenkinsfile' % repo)
-    gh_utils.push_file('Jenkinsfile', jenkinsfile, 'Update Jenkinsfile', repo, branch=branch)
+    logger.debug('Pushing JePL files to GitHub repository <%s>' % repo)
+    await gh_utils.push_files(
+        repo,
+        {
+            '.sqa/config.yml': config_yml,
+            '.sqa/docker-compose.yml': composer_yml,
+            'Jenkinsfile': jenkinsfile,
+        },
+        'Update JePL files',
+        branch=branch)
     logger.info('GitHub repository <%s> created with the JePL file structure' % repo)
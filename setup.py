@@ -37,7 +37,9 @@ setup(
         '../etc/sqaaas.ini.sample']},
     include_package_data=False,
     entry_points={
-        'console_scripts': ['sqaaas_api_server=openapi_server.__main__:main']},
+        'console_scripts': [
+            'sqaaas_api_server=openapi_server.__main__:main',
+            'sqaaas_api_migrate_db=openapi_server:migrate_db']},
     long_description="""\
     API for the Software and Service Quality Assurance as a Service (SQAaaS) component.
     """
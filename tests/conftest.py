@@ -4,6 +4,13 @@ import os
 
 import connexion
 
+from openapi_server import config
+
+
+# The controllers read the configuration when they are imported
+config.init(os.path.join(
+    os.path.dirname(__file__), '..', 'etc', 'sqaaas.ini.sample'))
+
 
 @pytest.fixture
 def client(loop, aiohttp_client):
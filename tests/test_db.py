@@ -0,0 +1,289 @@
+# coding: utf-8
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+import openapi_server
+
+from openapi_server.controllers import db
+
+
+JOURNAL_MAX_SIZE = 1048576
+
+
+def test_journal_replay(tmp_path):
+    db_file = tmp_path / 'sqaaas.json'
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    backend.apply({'a': {'name': 'a'}, 'b': {'name': 'b'}})
+    backend.apply({'a': None, 'b': {'name': 'b2'}})
+    assert backend.load() == {'b': {'name': 'b2'}}
+
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    assert backend.load() == {'b': {'name': 'b2'}}
+    assert not db_file.exists()
+
+
+def test_journal_truncates_torn_record(tmp_path):
+    db_file = tmp_path / 'sqaaas.json'
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    backend.apply({'a': {'name': 'a'}})
+    journal_size = backend.journal_file.stat().st_size
+    with backend.journal_file.open('ab') as f:
+        f.write(b'{"op": "put", "id": "b", "da')
+
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    assert backend.load() == {'a': {'name': 'a'}}
+    assert backend.journal_file.stat().st_size == journal_size
+
+    # New records are not appended to the torn one
+    backend.apply({'c': {'name': 'c'}})
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    assert backend.load() == {'a': {'name': 'a'}, 'c': {'name': 'c'}}
+
+
+def test_journal_compaction(tmp_path):
+    db_file = tmp_path / 'sqaaas.json'
+    backend = db.JournalBackend(db_file, 1)
+    backend.apply({'a': {'name': 'a'}, 'b': {'name': 'b'}})
+    backend._compaction.join()
+    assert not backend.rotated_journal_file.exists()
+    assert not backend.journal_file.exists()
+
+    backend.apply({'a': None})
+    backend._compaction.join()
+    assert backend.load() == {'b': {'name': 'b'}}
+
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    assert backend.load() == {'b': {'name': 'b'}}
+
+
+def test_journal_compaction_resumed_at_startup(tmp_path):
+    db_file = tmp_path / 'sqaaas.json'
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    backend.apply({'a': {'name': 'a'}})
+    # Journal rotated, but the server stopped before the compaction
+    backend.journal_file.rename(backend.rotated_journal_file)
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    backend.apply({'b': {'name': 'b'}})
+    assert backend.load() == {'a': {'name': 'a'}, 'b': {'name': 'b'}}
+
+    backend._compaction.join()
+    assert not backend.rotated_journal_file.exists()
+    backend = db.JournalBackend(db_file, JOURNAL_MAX_SIZE)
+    assert backend.load() == {'a': {'name': 'a'}, 'b': {'name': 'b'}}
+
+
+def get_pipeline(name):
+    return {
+        'name': name,
+        'pipeline_repo': 'org/%s' % name,
+        'jenkins': {'job_name': 'org/%s/sqaaas' % name},
+    }
+
+
+def test_sqlite_apply(tmp_path):
+    db_file = tmp_path / 'sqaaas.db'
+    backend = db.SQLiteBackend(db_file)
+    backend.apply({'a': get_pipeline('a'), 'b': get_pipeline('b')})
+    backend.apply({'a': None, 'c': get_pipeline('c')})
+    assert backend.ids() == {'b', 'c'}
+    assert backend.get('b') == get_pipeline('b')
+    assert backend.get('a') is None
+
+    backend = db.SQLiteBackend(db_file)
+    assert backend.load() == {'b': get_pipeline('b'), 'c': get_pipeline('c')}
+    # Columns used by the indexes
+    rows = sqlite3.connect(str(db_file)).execute(
+        'SELECT pipeline_id, pipeline_repo, job_name FROM pipelines'
+        ' ORDER BY pipeline_id').fetchall()
+    assert rows == [('b', 'org/b', 'org/b/sqaaas'), ('c', 'org/c', 'org/c/sqaaas')]
+
+
+def test_sqlite_get_many(tmp_path):
+    backend = db.SQLiteBackend(tmp_path / 'sqaaas.db')
+    backend.apply({'a': get_pipeline('a'), 'b': get_pipeline('b')})
+    # Requested order is kept, missing pipelines are None
+    assert backend.get_many(['b', 'missing', 'a']) == [
+        ('b', get_pipeline('b')), ('missing', None), ('a', get_pipeline('a'))]
+
+
+def test_sqlite_store(tmp_path):
+    backend = db.SQLiteBackend(tmp_path / 'sqaaas.db')
+    backend.apply({'a': get_pipeline('a'), 'b': get_pipeline('b')})
+    backend.store({'b': {'name': 'b2'}, 'c': get_pipeline('c')})
+    assert backend.load() == {'b': {'name': 'b2'}, 'c': get_pipeline('c')}
+
+
+def test_sqlite_connection_per_thread(tmp_path):
+    backend = db.SQLiteBackend(tmp_path / 'sqaaas.db')
+    backend.apply({'a': get_pipeline('a')})
+    conn = backend._get_connection()
+    assert conn is backend._get_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+    results = []
+
+    def read():
+        results.append((backend._get_connection(), backend.get('a')))
+    # Readers are not blocked by a write in progress
+    writer_conn = sqlite3.connect(str(backend.db_file))
+    writer_conn.execute('BEGIN IMMEDIATE')
+    writer_conn.execute('DELETE FROM pipelines')
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    writer_conn.rollback()
+    assert results[0][0] is not conn
+    assert results[0][1] == get_pipeline('a')
+
+
+def test_sqlite_import(tmp_path, monkeypatch):
+    backend = db.SQLiteBackend(tmp_path / 'sqaaas.db')
+    backend.apply({'a': get_pipeline('a'), 'b': get_pipeline('b')})
+    monkeypatch.setattr(db, 'backend', backend)
+    db_file = tmp_path / 'sqaaas.json'
+    db_file.write_text(json.dumps({'b': {'name': 'b2'}, 'c': get_pipeline('c')}))
+    config_file = os.path.join(
+        os.path.dirname(__file__), '..', 'etc', 'sqaaas.ini.sample')
+    monkeypatch.setattr(
+        sys, 'argv', ['sqaaas_api_migrate_db', '-c', config_file, str(db_file)])
+    openapi_server.migrate_db()
+    assert backend.load() == {
+        'a': get_pipeline('a'), 'b': {'name': 'b2'}, 'c': get_pipeline('c')}
+
+
+def test_shard_index_rebuilt(tmp_path):
+    db_dir = tmp_path / 'pipelines'
+    db_dir.mkdir()
+    for name in ['a', 'b']:
+        (db_dir / ('%s.json' % name)).write_text(json.dumps(get_pipeline(name)))
+    backend = db.ShardedBackend(db_dir)
+    assert backend.ids() == {'a', 'b'}
+    assert json.loads(backend.index_file.read_text()) == ['a', 'b']
+    assert backend.load() == {'a': get_pipeline('a'), 'b': get_pipeline('b')}
+
+
+def test_shard_apply(tmp_path):
+    db_dir = tmp_path / 'pipelines'
+    backend = db.ShardedBackend(db_dir)
+    backend.apply({'a': get_pipeline('a'), 'b': get_pipeline('b')})
+    backend.apply({'a': None, 'b': {'name': 'b2'}})
+    assert not (db_dir / 'a.json').exists()
+    assert json.loads((db_dir / 'b.json').read_text()) == {'name': 'b2'}
+    assert backend.get_many(['b', 'a']) == [('b', {'name': 'b2'}), ('a', None)]
+
+    backend = db.ShardedBackend(db_dir)
+    assert backend.load() == {'b': {'name': 'b2'}}
+
+
+def test_shard_store(tmp_path):
+    db_dir = tmp_path / 'pipelines'
+    backend = db.ShardedBackend(db_dir)
+    backend.apply({'a': get_pipeline('a'), 'b': get_pipeline('b')})
+    backend.store({'b': {'name': 'b2'}, 'c': get_pipeline('c')})
+    assert not (db_dir / 'a.json').exists()
+    backend = db.ShardedBackend(db_dir)
+    assert backend.load() == {'b': {'name': 'b2'}, 'c': get_pipeline('c')}
+
+
+def test_shard_atomic_writes(tmp_path, monkeypatch):
+    db_dir = tmp_path / 'pipelines'
+    backend = db.ShardedBackend(db_dir)
+    backend.apply({'a': get_pipeline('a')})
+
+    def replace(src, dst):
+        raise OSError('No space left on device')
+    monkeypatch.setattr(db.os, 'replace', replace)
+    with pytest.raises(OSError):
+        backend.apply({'a': {'name': 'a2'}, 'b': get_pipeline('b')})
+    monkeypatch.undo()
+    # Neither partial files nor index changes are left
+    assert sorted([path.name for path in db_dir.iterdir()]) == [
+        '.index.lock', 'a.json', 'index.json']
+    backend = db.ShardedBackend(db_dir)
+    assert backend.load() == {'a': get_pipeline('a')}
+
+
+def test_shard_index_changed_by_other_process(tmp_path):
+    db_dir = tmp_path / 'pipelines'
+    backend = db.ShardedBackend(db_dir)
+    # e.g. sqaaas_api_migrate_db, while the server is running
+    db.ShardedBackend(db_dir).apply({'imported': get_pipeline('imported')})
+    backend.apply({'a': get_pipeline('a')})
+    assert db.ShardedBackend(db_dir).ids() == {'imported', 'a'}
+
+
+class CountingBackend(db.FileBackend):
+    """File backend that records the changes applied in each commit."""
+    def __init__(self, db_file):
+        super().__init__(db_file)
+        self.commits = []
+
+    def apply(self, changes):
+        self.commits.append(changes)
+        super().apply(changes)
+
+
+async def test_writer_batches_mutations(tmp_path):
+    backend = CountingBackend(tmp_path / 'sqaaas.json')
+    writer = db.Writer(backend, 0.01)
+    await asyncio.gather(
+        writer.submit('put', 'a', {'name': 'a'}),
+        writer.submit('put', 'b', {'name': 'b'}),
+        writer.submit('update', 'a', {'x': 1}),
+        writer.submit('delete', 'b'),
+    )
+    assert len(backend.commits) == 1
+    assert backend.load() == {'a': {'name': 'a', 'x': 1}}
+
+    await writer.submit('update', 'a', {'y': 2})
+    assert len(backend.commits) == 2
+    assert backend.load() == {'a': {'name': 'a', 'x': 1, 'y': 2}}
+
+
+async def test_writer_update_if_match(tmp_path):
+    backend = CountingBackend(tmp_path / 'sqaaas.json')
+    writer = db.Writer(backend, 0.01)
+    await writer.submit('put', 'a', {'name': 'a', 'build': 1})
+    await asyncio.gather(
+        writer.submit('update', 'a', {'build': 2}, if_match={'build': 1}),
+        writer.submit('update', 'a', {'build': 3}, if_match={'build': 1}),
+        writer.submit('update', 'unknown', {'build': 2}),
+    )
+    assert backend.load() == {'a': {'name': 'a', 'build': 2}}
+
+
+async def test_writer_failure(tmp_path):
+    backend = CountingBackend(tmp_path / 'sqaaas.json')
+    writer = db.Writer(backend, 0.01)
+    backend.db_file = tmp_path / 'missing' / 'sqaaas.json'
+    (tmp_path / 'missing').write_text('not a folder')
+    results = await asyncio.gather(
+        writer.submit('put', 'a', {'name': 'a'}),
+        writer.submit('put', 'b', {'name': 'b'}),
+        return_exceptions=True)
+    assert all([isinstance(r, OSError) for r in results])
+
+    # The next batch is not affected
+    backend.db_file = tmp_path / 'sqaaas.json'
+    await writer.submit('put', 'c', {'name': 'c'})
+    assert backend.load() == {'c': {'name': 'c'}}
+
+
+async def test_writer_io_stats(tmp_path):
+    writer = db.Writer(db.FileBackend(tmp_path / 'sqaaas.json'), 0.01)
+
+    async def store(pipeline_id, data):
+        stats = db.start_io_stats()
+        await writer.submit('put', pipeline_id, data)
+        return stats
+
+    data = [{'name': 'a'}, {'name': 'bbbb'}]
+    stats = await asyncio.gather(store('a', data[0]), store('b', data[1]))
+    assert [s['written'] for s in stats] == [len(json.dumps(d)) for d in data]
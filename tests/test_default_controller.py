@@ -1,8 +1,10 @@
 # coding: utf-8
 
+import asyncio
 import pytest
 import json
 from aiohttp import web
+from types import SimpleNamespace
 
 from openapi_server.models.inline_object import InlineObject
 from openapi_server.models.inline_response200 import InlineResponse200
@@ -207,6 +209,67 @@ async def test_get_compressed_files(client):
     assert response.status == 200, 'Response body is : ' + (await response.read()).decode('utf-8')
 
 
+async def test_handle_ci_event(client):
+    """Test case for handle_ci_event
+
+    Receives Jenkins build notifications.
+    """
+    body = {
+  "name" : "main",
+  "url" : "job/my_org/job/my_repo/job/main/",
+  "build" : {
+    "full_url" : "https://jenkins.example.org/job/my_org/job/my_repo/job/main/1/",
+    "number" : 1,
+    "phase" : "COMPLETED",
+    "status" : "SUCCESS"
+  }
+}
+    params = [('token', 'token_example')]
+    headers = {
+        'Content-Type': 'application/json',
+    }
+    response = await client.request(
+        method='POST',
+        path='/v1/ci/events',
+        headers=headers,
+        json=body,
+        params=params,
+        )
+    assert response.status == 403, 'Response body is : ' + (await response.read()).decode('utf-8')
+
+
+async def test_get_metrics(client):
+    """Test case for get_metrics
+
+    Gets server metrics.
+    """
+    headers = { 
+        'Accept': 'application/json',
+    }
+    response = await client.request(
+        method='GET',
+        path='/v1/metrics',
+        headers=headers,
+        )
+    assert response.status == 200, 'Response body is : ' + (await response.read()).decode('utf-8')
+
+
+async def test_get_operation_by_id(client):
+    """Test case for get_operation_by_id
+
+    Get operation status.
+    """
+    headers = { 
+        'Accept': 'application/json',
+    }
+    response = await client.request(
+        method='GET',
+        path='/v1/operation/{operation_id}'.format(operation_id='operation_id_example'),
+        headers=headers,
+        )
+    assert response.status == 404, 'Response body is : ' + (await response.read()).decode('utf-8')
+
+
 async def test_get_pipeline_by_id(client):
     """Test case for get_pipeline_by_id
 
@@ -287,11 +350,51 @@ async def test_get_pipeline_status(client):
     assert response.status == 200, 'Response body is : ' + (await response.read()).decode('utf-8')
 
 
+async def test_get_pipeline_status_stream(client):
+    """Test case for get_pipeline_status_stream
+
+    Stream pipeline status.
+    """
+    headers = {
+        'Accept': 'text/event-stream',
+    }
+    response = await client.request(
+        method='GET',
+        path='/v1/pipeline/{pipeline_id}/status/stream'.format(pipeline_id='pipeline_id_example'),
+        headers=headers,
+        )
+    assert response.status == 400, 'Response body is : ' + (await response.read()).decode('utf-8')
+
+
+async def test_get_pipeline_statuses(client):
+    """Test case for get_pipeline_statuses
+
+    Get the status of several pipelines.
+    """
+    body = {
+  "pipeline_ids" : [ "pipeline_ids", "pipeline_ids" ]
+}
+    headers = {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+    }
+    response = await client.request(
+        method='POST',
+        path='/v1/pipeline/status:batch',
+        headers=headers,
+        json=body,
+        )
+    assert response.status == 200, 'Response body is : ' + (await response.read()).decode('utf-8')
+
+
 async def test_get_pipelines(client):
     """Test case for get_pipelines
 
     Gets pipeline IDs.
     """
+    params = [('limit', 56),
+                    ('cursor', 'cursor_example'),
+                    ('fields', 'fields_example')]
     headers = { 
         'Accept': 'application/json',
     }
@@ -299,6 +402,7 @@ async def test_get_pipelines(client):
         method='GET',
         path='/v1/pipeline',
         headers=headers,
+        params=params,
         )
     assert response.status == 200, 'Response body is : ' + (await response.read()).decode('utf-8')
 
@@ -318,3 +422,74 @@ async def test_run_pipeline(client):
         )
     assert response.status == 200, 'Response body is : ' + (await response.read()).decode('utf-8')
 
+
+
+class FakeJenkinsQueue(object):
+    """Build queue whose item leaves the queue after a number of polls."""
+    def __init__(self, polls):
+        self.polls = polls
+        self.calls = []
+
+    async def get_queue_item(self, item_no):
+        self.calls.append(('get_queue_item', item_no))
+        if len(self.calls) < self.polls:
+            return {'id': item_no, 'why': 'Waiting for next available executor'}
+        return {'id': item_no, 'executable': {'number': 1, 'url': 'http://b/1'}}
+
+    async def cancel_queue(self, item_no):
+        self.calls.append(('cancel_queue', item_no))
+
+
+@pytest.fixture
+def queue_sleeps(monkeypatch):
+    from openapi_server.controllers import default_controller
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        await asyncio.sleep(seconds)
+    monkeypatch.setattr(
+        default_controller, 'asyncio', SimpleNamespace(sleep=sleep))
+    monkeypatch.setattr(default_controller, 'JENKINS_QUEUE_POLL_MIN', 0.01)
+    monkeypatch.setattr(default_controller, 'JENKINS_QUEUE_POLL_MAX', 0.04)
+    return sleeps
+
+
+async def test_wait_for_build(queue_sleeps, monkeypatch):
+    from openapi_server.controllers import default_controller
+    from openapi_server.controllers import metrics
+    jk_queue = FakeJenkinsQueue(polls=6)
+    monkeypatch.setattr(default_controller, 'jk_utils', jk_queue)
+    queue_wait_count = metrics.get_all().get(
+        'jenkins_queue_wait_seconds', {}).get('count', 0)
+    build = await default_controller._wait_for_build('org/repo/sqaaas', 7)
+    assert build == {'number': 1, 'url': 'http://b/1'}
+    # Doubled up to JENKINS_QUEUE_POLL_MAX
+    assert queue_sleeps == [0.01, 0.02, 0.04, 0.04, 0.04]
+    assert jk_queue.calls == [('get_queue_item', 7)] * 6
+    assert metrics.get_all()['jenkins_queue_wait_seconds']['count'] == queue_wait_count + 1
+
+
+async def test_wait_for_build_timeout(queue_sleeps, monkeypatch):
+    from jenkins import JenkinsException
+    from openapi_server.controllers import default_controller
+    from openapi_server.controllers import utils as ctls_utils
+    jk_queue = FakeJenkinsQueue(polls=100)
+    monkeypatch.setattr(default_controller, 'jk_utils', jk_queue)
+    monkeypatch.setattr(default_controller, 'JENKINS_QUEUE_TIMEOUT', 0.05)
+    with pytest.raises(JenkinsException) as e:
+        await default_controller._wait_for_build('org/repo/sqaaas', 7)
+    assert ctls_utils.get_upstream_error(e.value)['upstream_status'] == 504
+    assert jk_queue.calls[-1] == ('cancel_queue', 7)
+    # The last sleep is cut to the deadline
+    assert queue_sleeps[:2] == [0.01, 0.02]
+    assert sum(queue_sleeps) <= 0.05
+
+
+async def test_handle_ci_event_invalid_token(monkeypatch):
+    from openapi_server.controllers import default_controller
+    monkeypatch.setattr(default_controller, 'JENKINS_EVENTS_TOKEN', 'sécret')
+    body = {'url': 'job/org/job/repo/job/sqaaas/', 'build': {'phase': 'STARTED'}}
+    for token in [None, 'secret', 'é']:
+        response = await default_controller.handle_ci_event(None, body, token=token)
+        assert response.status == 401
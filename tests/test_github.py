@@ -0,0 +1,215 @@
+# coding: utf-8
+
+import time
+
+import pytest
+
+from types import SimpleNamespace
+
+from github.GithubException import GithubException
+from github.GithubException import RateLimitExceededException
+
+from openapi_server.controllers.github import get_blob_sha
+from openapi_server.controllers.github import GitHubUtils
+from openapi_server.controllers.github import RateLimiter
+
+
+class FakeClient(object):
+    """Holds the rate limit values that github.Github gets from GitHub."""
+    def __init__(self, remaining, reset_in):
+        self.rate_limiting = (remaining, 5000)
+        self.rate_limiting_resettime = time.time() + reset_in
+
+
+def test_get_blob_sha():
+    # As returned by 'git hash-object'
+    assert get_blob_sha('') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+    assert get_blob_sha('hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'
+    assert get_blob_sha(b'hello\n') == get_blob_sha('hello\n')
+    assert get_blob_sha('ñ') == get_blob_sha('ñ'.encode('utf-8'))
+
+
+def test_rate_limiter_burst():
+    rate_limiter = RateLimiter(
+        FakeClient(10, 3600), burst=3, reserve=0, max_wait=1)
+    for _ in range(3):
+        rate_limiter.acquire()
+    assert rate_limiter.remaining == 10
+    # 10 requests left for the next hour
+    with pytest.raises(RateLimitExceededException):
+        rate_limiter.acquire()
+
+
+def test_rate_limiter_pacing():
+    rate_limiter = RateLimiter(
+        FakeClient(1000, 10), burst=1, reserve=0, max_wait=1)
+    assert rate_limiter.acquire() == 0
+    # 100 requests per second, so the next turns are 10ms apart
+    waits = [rate_limiter.acquire() for _ in range(5)]
+    assert waits == sorted(waits)
+    assert 0.005 <= waits[0] <= 0.011
+    assert 0.045 <= waits[-1] <= 0.051
+
+
+def test_acquire_turn():
+    gh_utils = GitHubUtils('token', ratelimit_burst=1, ratelimit_reserve=0)
+    gh_utils.client = FakeClient(1000, 10)
+    gh_utils.rate_limiter.client = gh_utils.client
+    assert gh_utils.acquire_turn('_get_blob_shas') == 0
+    assert gh_utils.acquire_turn('push_files') == 0
+    assert gh_utils.acquire_turn('create_fork') > 0
+
+
+def test_rate_limiter_reserve():
+    rate_limiter = RateLimiter(
+        FakeClient(50, 3600), burst=1, reserve=100, max_wait=1)
+    with pytest.raises(RateLimitExceededException):
+        rate_limiter.acquire(urgent=False)
+    rate_limiter.acquire()
+
+
+class FakeRepository(object):
+    """Repository object that counts its (conditional) refreshes."""
+    def __init__(self, full_name):
+        self.full_name = full_name
+        self.url = 'https://api.github.com/repos/%s' % full_name
+        self.raw_data = {'full_name': full_name}
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+        return False
+
+
+def test_get_repository_revalidation():
+    gh_utils = GitHubUtils('token', cache_ttl=0.05, cache_size=1)
+    fetched = []
+
+    def get_repo(repo_name):
+        fetched.append(repo_name)
+        return FakeRepository(repo_name)
+    gh_utils.client.get_repo = get_repo
+    assert gh_utils.get_repository('org/Repo') == {'full_name': 'org/Repo'}
+    repo = gh_utils._get_repo('org/repo')
+    # Fresh: served from the cache
+    gh_utils.get_repository('org/repo')
+    assert (fetched, repo.updates) == (['org/Repo'], 0)
+    # Revalidated (not fetched again) once cache_ttl expires
+    time.sleep(0.06)
+    gh_utils.get_repository('org/repo')
+    gh_utils.get_repository('org/repo')
+    assert (fetched, repo.updates) == (['org/Repo'], 1)
+    # Only dropped when the cache is full
+    gh_utils.get_repository('org/other')
+    gh_utils.get_repository('org/repo')
+    assert fetched == ['org/Repo', 'org/other', 'org/repo']
+
+
+class FakeRepo(object):
+    """Repository with a single commit per branch, for the Git Data API."""
+    def __init__(self, files=None, branches=None, default_branch='main'):
+        """FakeRepo object definition.
+
+        :param files: dict with the file paths and contents of all branches
+        :param branches: list of branch names (None if the repo is empty)
+        """
+        self.files = files or {}
+        self.branches = branches
+        self.default_branch = default_branch
+        self.calls = []
+
+    def _get_ref(self, branch):
+        return SimpleNamespace(
+            object=SimpleNamespace(sha='head'),
+            edit=lambda sha: self.calls.append(('edit', branch, sha)))
+
+    def get_git_ref(self, ref):
+        if self.branches is None:
+            raise GithubException(409, {'message': 'Git Repository is empty.'}, None)
+        branch = ref.split('/', 1)[1]
+        if branch not in self.branches:
+            raise GithubException(404, {'message': 'Not Found'}, None)
+        return self._get_ref(branch)
+
+    def create_git_ref(self, ref, sha):
+        self.calls.append(('create_git_ref', ref, sha))
+        self.branches.append(ref.split('/', 2)[2])
+        return self._get_ref(ref.split('/', 2)[2])
+
+    def create_file(self, path, message, content, branch):
+        self.calls.append(('create_file', path, branch))
+        self.files[path] = content
+        self.branches = [branch]
+
+    def get_git_commit(self, sha):
+        return SimpleNamespace(sha=sha, tree=SimpleNamespace(sha='tree:'))
+
+    def get_git_tree(self, sha, recursive=False):
+        # Tree SHAs are the folder paths, prefixed with 'tree:'
+        assert not recursive
+        sha = sha.split(':', 1)[1]
+        elements = {}
+        for path, content in self.files.items():
+            if path.startswith(sha):
+                name = path[len(sha):].lstrip('/').split('/')
+                if len(name) == 1:
+                    elements[name[0]] = get_blob_sha(content)
+                else:
+                    elements[name[0]] = 'tree:' + '/'.join([sha, name[0]]).lstrip('/')
+        self.calls.append(('get_git_tree', sha))
+        return SimpleNamespace(tree=[
+            SimpleNamespace(path=path, sha=sha) for path, sha in elements.items()
+        ])
+
+    def create_git_tree(self, elements, base_tree):
+        self.calls.append(('create_git_tree', sorted([
+            element._identity['path'] for element in elements])))
+        return 'tree'
+
+    def create_git_commit(self, message, tree, parents):
+        return SimpleNamespace(sha='commit')
+
+
+def push_files(repo):
+    gh_utils = GitHubUtils('token')
+    gh_utils._get_repo = lambda repo_name, revalidate=False: repo
+    gh_utils.push_files('org/repo', JEPL_FILES, 'Update JePL files')
+    return repo.calls
+
+
+JEPL_FILES = {
+    '.sqa/config.yml': 'config',
+    '.sqa/docker-compose.yml': 'composer',
+    'Jenkinsfile': 'jenkinsfile',
+}
+
+
+def test_push_files_empty_repository():
+    assert push_files(FakeRepo()) == [
+        ('create_file', '.sqa/config.yml', 'sqaaas'),
+        ('get_git_tree', ''),
+        ('get_git_tree', '.sqa'),
+        ('create_git_tree', ['.sqa/docker-compose.yml', 'Jenkinsfile']),
+        ('edit', 'sqaaas', 'commit'),
+    ]
+
+
+def test_push_files_missing_branch():
+    assert push_files(FakeRepo({'README': 'readme'}, ['main'])) == [
+        ('create_git_ref', 'refs/heads/sqaaas', 'head'),
+        ('get_git_tree', ''),
+        ('create_git_tree', sorted(JEPL_FILES)),
+        ('edit', 'sqaaas', 'commit'),
+    ]
+
+
+def test_push_files_changed_files():
+    files = dict(JEPL_FILES, **{'Jenkinsfile': 'old', 'README': 'readme'})
+    assert push_files(FakeRepo(files, ['sqaaas']))[-2:] == [
+        ('create_git_tree', ['Jenkinsfile']),
+        ('edit', 'sqaaas', 'commit'),
+    ]
+    assert push_files(FakeRepo(dict(JEPL_FILES), ['sqaaas'])) == [
+        ('get_git_tree', ''),
+        ('get_git_tree', '.sqa'),
+    ]
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+import jenkins
+
+from openapi_server.controllers.jenkins import JenkinsUtils
+
+
+def test_get_job_name():
+    assert JenkinsUtils.get_job_name(
+        'job/my_org/job/my_repo/job/main/') == 'my_org/my_repo/main'
+    assert JenkinsUtils.get_job_name(
+        'https://jenkins.example.org/jenkins/job/my_org/job/my_repo/job/feature%2Fx/'
+    ) == 'my_org/my_repo/feature/x'
+    assert JenkinsUtils.get_job_name('job/my_org') == 'my_org'
+
+
+class FakeJenkins(object):
+    """Jenkins server with the last builds of each job in the folder info."""
+    def __init__(self, folders, older_builds):
+        self.folders = folders
+        self.older_builds = older_builds
+        self.calls = []
+
+    def get_info(self, item, query):
+        self.calls.append(('get_info', item))
+        assert query.startswith('?tree=jobs[name,jobs[name,builds[')
+        folder = item.split('/', 1)[1]
+        return {'jobs': [
+            {'name': repo_name, 'jobs': [
+                {'name': branch_name, 'builds': builds}
+                for branch_name, builds in branches.items()
+            ]}
+            for repo_name, branches in self.folders.get(folder, {}).items()
+        ]}
+
+    def get_build_info(self, full_job_name, build_no):
+        self.calls.append(('get_build_info', full_job_name, build_no))
+        try:
+            return dict(self.older_builds[(full_job_name, build_no)], duration=1)
+        except KeyError:
+            raise jenkins.NotFoundException()
+
+
+def get_build(number, result, job_url='job/org/job/repo/job/main/'):
+    return {'number': number, 'result': result, 'url': job_url + '%s/' % number}
+
+
+def test_get_build_statuses():
+    jk_utils = JenkinsUtils('https://jenkins.example.org/', 'user', 'token')
+    jk_utils.server = FakeJenkins(
+        {
+            'org': {
+                'repo': {'main': [get_build(3, None), get_build(2, 'SUCCESS')]},
+                'other': {'sqaaas': [get_build(1, 'FAILURE')]},
+            },
+            'org2': {'repo': {'main': [get_build(7, 'ABORTED')]}},
+        },
+        {('org/repo/main', 1): get_build(1, 'UNSTABLE')})
+    builds = [
+        ('org/repo/main', 3),
+        ('org/repo/main', 2),
+        ('org/other/sqaaas', 1),
+        ('org2/repo/main', 7),
+        # Older than the builds in the folder info
+        ('org/repo/main', 1),
+        ('org/missing/main', 1),
+    ]
+    assert jk_utils.get_build_statuses(builds) == {
+        ('org/repo/main', 3): get_build(3, None),
+        ('org/repo/main', 2): get_build(2, 'SUCCESS'),
+        ('org/other/sqaaas', 1): get_build(1, 'FAILURE'),
+        ('org2/repo/main', 7): get_build(7, 'ABORTED'),
+        ('org/repo/main', 1): get_build(1, 'UNSTABLE'),
+        ('org/missing/main', 1): None,
+    }
+    # Each folder is requested once
+    assert sorted(jk_utils.server.calls) == [
+        ('get_build_info', 'org/missing/main', 1),
+        ('get_build_info', 'org/repo/main', 1),
+        ('get_info', 'job/org'),
+        ('get_info', 'job/org2'),
+    ]
@@ -0,0 +1,107 @@
+# coding: utf-8
+
+import asyncio
+import time
+
+from github.GithubException import GithubException
+
+from openapi_server.controllers import default_controller
+from openapi_server.controllers import operations
+
+
+async def test_operation_succeeded():
+    started = asyncio.Event()
+    released = asyncio.Event()
+
+    async def func(operation):
+        operation.set_step('WORKING')
+        started.set()
+        await released.wait()
+        return {'build_no': 1}
+
+    operation = operations.start('pipeline', func)
+    assert operations.get(operation.id) is operation
+    assert operation.status == 'PENDING'
+    await started.wait()
+    assert (operation.status, operation.step) == ('RUNNING', 'WORKING')
+    released.set()
+    await operation._task
+    assert operation.to_dict() == {
+        'id': operation.id,
+        'pipeline_id': 'pipeline',
+        'status': 'SUCCEEDED',
+        'step': 'WORKING',
+        'result': {'build_no': 1},
+        'error': None,
+    }
+
+
+async def test_operation_failed_upstream():
+    async def func(operation):
+        raise GithubException(404, {'message': 'Not Found'}, None)
+
+    operation = operations.start('pipeline', func)
+    await operation._task
+    assert operation.status == 'FAILED'
+    assert operation.error == {
+        'upstream_status': 404, 'upstream_reason': 'Not Found'}
+
+
+async def test_operation_failed():
+    async def func(operation):
+        raise ValueError('Unexpected value')
+
+    operation = operations.start('pipeline', func)
+    await operation._task
+    assert operation.status == 'FAILED'
+    assert operation.error == {'reason': 'Unexpected value'}
+
+
+async def test_operation_purged():
+    released = asyncio.Event()
+
+    async def finished(operation):
+        return None
+
+    async def unfinished(operation):
+        await released.wait()
+
+    operation = operations.start('pipeline', finished)
+    running = operations.start('pipeline', unfinished)
+    await operation._task
+    # Finished operations are kept for OPERATION_TTL seconds
+    operations.start('pipeline', finished)
+    assert operations.get(operation.id) is operation
+    operation.finished_at = time.time() - operations.OPERATION_TTL - 1
+    operations.start('pipeline', finished)
+    assert operations.get(operation.id) is None
+    # Unfinished operations are never purged
+    assert operations.get(running.id) is running
+    released.set()
+    await running._task
+
+
+async def test_pending_run_status():
+    released = asyncio.Event()
+
+    async def func(operation):
+        await released.wait()
+        raise ValueError('Push failed')
+
+    operation = operations.start('pipeline', func)
+    jenkins_info = {
+        'job_name': None,
+        'build_info': {'number': None, 'url': None},
+        'scan_org_wait': False,
+        'operation_id': operation.id,
+    }
+    # Not final while the run operation works
+    assert default_controller._get_pending_run_status(jenkins_info) is None
+    await asyncio.sleep(0)
+    assert default_controller._get_pending_run_status(jenkins_info) is None
+    released.set()
+    await operation._task
+    assert default_controller._get_pending_run_status(jenkins_info) == 'NOT_BUILT'
+    # Operation not known anymore, e.g. after a restart
+    jenkins_info['operation_id'] = 'unknown'
+    assert default_controller._get_pending_run_status(jenkins_info) == 'NOT_BUILT'
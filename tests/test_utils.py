@@ -0,0 +1,270 @@
+# coding: utf-8
+
+import asyncio
+import threading
+
+import pytest
+
+from openapi_server.controllers import utils as ctls_utils
+
+
+class FakeClient(object):
+    """Blocking API client whose read calls wait until released."""
+    def __init__(self):
+        self.calls = []
+        self.released = threading.Event()
+
+    def get_item(self, name, fail=False):
+        self.calls.append(('get_item', name))
+        self.released.wait(5)
+        if fail:
+            raise ValueError(name)
+        return {'name': name}
+
+    def set_item(self, name):
+        self.calls.append(('set_item', name))
+
+    def get_items(self, names):
+        self.calls.append(('get_items', names))
+        return [{'name': name} for name in names]
+
+    def get_state(self, name):
+        self.calls.append(('get_state', name))
+        self.released.wait(5)
+        return {'name': name, 'calls': len(self.calls)}
+
+
+executor = ctls_utils.UpstreamExecutor('test', 4)
+
+
+def get_threaded_utils(cache_ttl=0):
+    client = FakeClient()
+    utils = ctls_utils.ThreadedUtils(
+        client,
+        executor,
+        shared_methods=['get_item', 'get_state'],
+        read_methods=['get_items'],
+        polled_methods=['get_state'],
+        cache_ttl=cache_ttl)
+    return client, utils
+
+
+async def test_threaded_utils_shares_concurrent_calls():
+    client, utils = get_threaded_utils()
+    futures = [
+        asyncio.ensure_future(utils.get_item(name))
+        for name in ['a', 'a', 'a', 'b']
+    ]
+    await asyncio.sleep(0.05)
+    client.released.set()
+    results = await asyncio.gather(*futures)
+    assert results == [{'name': 'a'}] * 3 + [{'name': 'b'}]
+    assert sorted(client.calls) == [('get_item', 'a'), ('get_item', 'b')]
+
+    # Not reused once finished
+    await utils.get_item('a')
+    assert client.calls.count(('get_item', 'a')) == 2
+
+
+async def test_threaded_utils_shares_exceptions():
+    client, utils = get_threaded_utils()
+    futures = [
+        asyncio.ensure_future(utils.get_item('a', fail=True)) for _ in range(2)
+    ]
+    await asyncio.sleep(0.05)
+    client.released.set()
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    assert all([isinstance(r, ValueError) for r in results])
+    assert len(client.calls) == 1
+
+
+async def test_threaded_utils_cancelled_caller():
+    client, utils = get_threaded_utils()
+    cancelled = asyncio.ensure_future(utils.get_item('a'))
+    waiting = asyncio.ensure_future(utils.get_item('a'))
+    await asyncio.sleep(0.05)
+    cancelled.cancel()
+    client.released.set()
+    assert await waiting == {'name': 'a'}
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert len(client.calls) == 1
+
+
+async def test_threaded_utils_acquire_turn():
+    client = FakeClient()
+    client.released.set()
+    turns = []
+
+    def acquire_turn(name):
+        turns.append(name)
+        return 0.2 if name == 'get_item' else 0
+    # Single worker, which is not held by the calls waiting for their turn
+    utils = ctls_utils.ThreadedUtils(
+        client,
+        ctls_utils.UpstreamExecutor('test_turn', 1),
+        shared_methods=['get_item'],
+        acquire_turn=acquire_turn)
+    paced = [asyncio.ensure_future(utils.get_item('a')) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    await asyncio.wait_for(utils.set_item('b'), 0.1)
+    assert client.calls == [('set_item', 'b')]
+    assert await asyncio.gather(*paced) == [{'name': 'a'}] * 2
+    # Shared calls take a single turn
+    assert turns == ['get_item', 'set_item']
+
+
+async def test_threaded_utils_unhashable_arguments():
+    client, utils = get_threaded_utils()
+    client.released.set()
+    await asyncio.gather(utils.get_item(['a']), utils.get_item(['a']))
+    assert len(client.calls) == 2
+
+
+async def test_threaded_utils_cache():
+    client, utils = get_threaded_utils(cache_ttl=60)
+    client.released.set()
+    assert await utils.get_item('a') == await utils.get_item('a')
+    assert client.calls == [('get_item', 'a')]
+
+    # Writes discard the cached results
+    await utils.set_item('a')
+    await utils.get_item('a')
+    assert client.calls.count(('get_item', 'a')) == 2
+
+
+async def test_threaded_utils_read_methods():
+    client, utils = get_threaded_utils(cache_ttl=60)
+    client.released.set()
+    await utils.get_item('a')
+    # Reads do not discard the cached results
+    assert await utils.get_items(['a', 'b']) == [{'name': 'a'}, {'name': 'b'}]
+    await utils.get_item('a')
+    assert client.calls == [('get_item', 'a'), ('get_items', ['a', 'b'])]
+
+
+async def test_threaded_utils_polled_methods():
+    client, utils = get_threaded_utils(cache_ttl=60)
+    futures = [asyncio.ensure_future(utils.get_state('a')) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    client.released.set()
+    first, second = await asyncio.gather(*futures)
+    assert first == second
+    # Shared while in flight, but the result is not reused afterwards
+    assert await utils.get_state('a') != first
+    assert client.calls == [('get_state', 'a')] * 2
+
+
+async def test_threaded_utils_stale_results_not_cached():
+    client, utils = get_threaded_utils(cache_ttl=60)
+    future = asyncio.ensure_future(utils.get_item('a'))
+    await asyncio.sleep(0.05)
+    # Write while the read is in progress
+    await utils.set_item('a')
+    client.released.set()
+    await future
+    await utils.get_item('a')
+    assert client.calls.count(('get_item', 'a')) == 2
+
+
+async def test_coalesced_call():
+    calls = []
+
+    async def func():
+        calls.append(None)
+        return len(calls)
+
+    coalesced_call = ctls_utils.CoalescedCall(func, 0.05)
+    assert await asyncio.gather(*[coalesced_call() for _ in range(3)]) == [1] * 3
+    assert await coalesced_call() == 2
+
+
+async def test_coalesced_call_failure():
+    async def func():
+        raise ValueError()
+
+    coalesced_call = ctls_utils.CoalescedCall(func, 0.01)
+    # Unawaited requests do not leave unretrieved exceptions
+    coalesced_call.request()
+    results = await asyncio.gather(
+        coalesced_call(), coalesced_call(), return_exceptions=True)
+    assert all([isinstance(r, ValueError) for r in results])
+
+
+async def test_job_watcher():
+    jobs = {}
+
+    async def get_job_info(job_name):
+        return jobs.get(job_name, {})
+
+    watcher = ctls_utils.JobWatcher(
+        get_job_info, interval_min=0.01, interval_max=0.02, timeout=5)
+    future = watcher.watch('org/repo/main')
+    assert watcher.watch('org/repo/main') is future
+    await asyncio.sleep(0.05)
+    assert not future.done()
+    jobs['org/repo/main'] = {'lastBuild': {'number': 1, 'url': 'url'}}
+    assert await asyncio.wait_for(future, 1) == {'number': 1, 'url': 'url'}
+
+
+async def test_job_watcher_timeout():
+    async def get_job_info(job_name):
+        return {}
+
+    watcher = ctls_utils.JobWatcher(
+        get_job_info, interval_min=0.01, interval_max=0.02, timeout=0.05)
+    assert await asyncio.wait_for(watcher.watch('org/repo/main'), 1) is None
+
+
+async def test_job_watcher_notify():
+    async def get_job_info(job_name):
+        return {}
+
+    watcher = ctls_utils.JobWatcher(get_job_info, interval_min=10)
+    future = watcher.watch('org/repo/main')
+    watcher.notify('org/repo/other', {'number': 1, 'url': 'url'})
+    watcher.notify('org/repo/main', {'number': 2, 'url': 'url'})
+    assert future.result() == {'number': 2, 'url': 'url'}
+
+
+async def test_broadcaster():
+    values = {'pipeline': 'RUNNING'}
+    polls = []
+
+    async def get_value(key):
+        polls.append(key)
+        return values.get(key)
+
+    broadcaster = ctls_utils.Broadcaster(
+        get_value, lambda value: value in [None, 'SUCCESS'],
+        interval_min=0.01, interval_max=0.02)
+    queues = [broadcaster.subscribe('pipeline') for _ in range(2)]
+    for queue in queues:
+        assert await asyncio.wait_for(queue.get(), 1) == 'RUNNING'
+    # Unchanged values are not published again
+    await asyncio.sleep(0.05)
+    assert all([queue.empty() for queue in queues])
+    assert len(polls) > 1
+
+    values['pipeline'] = 'SUCCESS'
+    broadcaster.refresh('pipeline')
+    for queue in queues:
+        assert await asyncio.wait_for(queue.get(), 1) == 'SUCCESS'
+    for queue in queues:
+        broadcaster.unsubscribe('pipeline', queue)
+    await asyncio.sleep(0.01)
+    assert not broadcaster._subscribers
+    assert not broadcaster._values
+
+
+async def test_broadcaster_unsubscribe():
+    async def get_value(key):
+        return 'RUNNING'
+
+    broadcaster = ctls_utils.Broadcaster(
+        get_value, lambda value: False, interval_min=10)
+    queue = broadcaster.subscribe('pipeline')
+    assert await asyncio.wait_for(queue.get(), 1) == 'RUNNING'
+    broadcaster.unsubscribe('pipeline', queue)
+    await asyncio.sleep(0.01)
+    assert not broadcaster._subscribers